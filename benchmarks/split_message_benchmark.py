@@ -0,0 +1,47 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from cogs.telegram_chat_mirror import split_message
+
+
+# The previous splitter that slices and strips the remaining text on every part
+def legacy_split_message(text, limit=1900):
+    parts = []
+    while len(text) > limit:
+        index = text.rfind(" ", 0, limit)
+        if index == -1:
+            index = limit
+        parts.append(text[:index])
+        text = text[index:].strip()
+    parts.append(text)
+    return parts
+
+
+# Build a market report like text with paragraphs, links and code blocks
+def build_text(length):
+    paragraph = (
+        "BTC held the range above the weekly open while funding stayed flat, "
+        "see [the chart](https://example.com/chart/btc) and https://example.com/report for details.\n"
+    )
+    code_block = "```\n" + "\n".join(f"PAIR{i}/USDT  {i * 1.5:.2f}  {i % 7 - 3:+d}%" for i in range(20)) + "\n```\n"
+    text = ""
+    while len(text) < length:
+        text += paragraph * 5 + code_block
+    return text[:length]
+
+
+if __name__ == '__main__':
+    for length in (4_000, 40_000, 400_000, 4_000_000):
+        text = build_text(length)
+        number = max(1, 400_000 // length)
+
+        legacy_time = timeit.timeit(lambda: legacy_split_message(text), number=number) / number
+        split_time = timeit.timeit(lambda: split_message(text, header_length=40), number=number) / number
+
+        print(
+            f"{length:>7} chars | legacy: {legacy_time * 1000:8.3f} ms | "
+            f"split_message: {split_time * 1000:8.3f} ms | parts: {len(split_message(text, header_length=40))}"
+        )
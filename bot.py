@@ -61,6 +61,10 @@ if not logger.handlers:
     logger.addHandler(file_handler)
 
 
+# The cogs that the feature cogs depend on, they are always loaded and have no bot_feature switch
+REQUIRED_COGS = ('event_router', 'discord_outbox')
+
+
 # Initialize the bot
 class DiscordBot(commands.Bot):
     def __init__(self, *args, **kwargs) -> None:
@@ -71,7 +75,7 @@ class DiscordBot(commands.Bot):
     async def load_cogs(self) -> None:
         for extension in os.listdir(f"{os.path.realpath(os.path.dirname(__file__))}/cogs"):
             if extension.endswith('.py'):
-                if self.config["bot_feature"][extension[:-3]]:
+                if extension[:-3] in REQUIRED_COGS or self.config["bot_feature"][extension[:-3]]:
                     extension = extension[:-3]
                     try:
                         await self.load_extension(f"cogs.{extension}")
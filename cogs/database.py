@@ -1,13 +1,356 @@
+import discord
 from discord.ext import commands, tasks
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from tqdm import tqdm
 from tqdm.asyncio import tqdm_asyncio
+import sqlite3
 import asyncio
+import queue
+import json
+
+
+# Move the legacy telegram_messages rows with the JSON encoded discord message ids into telegram_discord_message
+def migrate_telegram_messages(cursor, batch_size) -> int:
+    rows = cursor.execute(
+        "SELECT message_id, datetime, discord_message_id FROM telegram_messages ORDER BY message_id LIMIT ?",
+        (batch_size,)
+    ).fetchall()
+
+    mappings = []
+    for message_id, message_datetime, discord_message_ids in rows:
+        try:
+            discord_message_ids = json.loads(discord_message_ids.strip()) if discord_message_ids else []
+        except ValueError:
+            discord_message_ids = []
+
+        # The group of the legacy rows is unknown, so they are saved with group_id 0
+        for part_index, discord_message_id in enumerate(discord_message_ids):
+            mappings.append((0, message_id, part_index, int(discord_message_id), None, message_datetime))
+
+    cursor.executemany(
+        """
+        INSERT OR IGNORE INTO telegram_discord_message (
+            group_id, telegram_message_id, part_index, discord_message_id, channel_id, datetime
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        mappings
+    )
+    cursor.executemany("DELETE FROM telegram_messages WHERE message_id = ?", [(row[0],) for row in rows])
+
+    return len(rows)
+
+
+# Ordered schema migrations as (version, description, steps), a step is either a SQL statement or a batch function
+# that receive the cursor and the batch size and return the processed row count, the batch function is called again
+# in a new transaction until it returns 0 so the migration of large tables does not block the other writers
+MIGRATIONS = [
+    (1, "Create the forum, treasury and telegram tables", [
+        """
+        CREATE TABLE IF NOT EXISTS forum_new_thread_message (
+            forum_new_thread_message_id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            created_at TEXT,
+            edited_at TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS forum_thread (
+            thread_id INTEGER PRIMARY KEY,
+            thread_name TEXT,
+            thread_location_id INTEGER,
+            thread_location TEXT,
+            author_id INTEGER,
+            author_name TEXT,
+            created_at TEXT,
+            jump_url TEXT,
+            member_count INTEGER,
+            message_count INTEGER,
+            locked BOOLEAN DEFAULT 0,
+            archived BOOLEAN DEFAULT 0,
+            forum_new_thread_message_id INTEGER,
+            FOREIGN KEY (forum_new_thread_message_id) REFERENCES forum_new_thread_message (forum_new_thread_message_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS forum_feed_message (
+            forum_feed_message_id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            created_at TEXT,
+            edited_at TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS forum_message (
+            message_id INTEGER PRIMARY KEY,
+            thread_location_id INTEGER,
+            author_id INTEGER,
+            author_name TEXT,
+            created_at TEXT,
+            edited_at TEXT,
+            forum_feed_message_id INTEGER,
+            FOREIGN KEY (forum_feed_message_id) REFERENCES forum_feed_message (forum_feed_message_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS treasury_monitoring (
+            tx_hash TEXT PRIMARY KEY,
+            value TEXT,
+            asset TEXT,
+            from_address TEXT,
+            to_address TEXT,
+            timestamp TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS telegram_messages (
+            message_id INTEGER PRIMARY KEY,
+            datetime TEXT,
+            discord_message_id TEXT
+        )
+        """,
+    ]),
+    (2, "Create the sync_state table", [
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            scope TEXT,
+            channel_id INTEGER,
+            last_message_id INTEGER,
+            synced_at TEXT,
+            PRIMARY KEY (scope, channel_id)
+        )
+        """,
+    ]),
+    (3, "Create the secondary indexes on forum_thread and forum_message", [
+        """
+        CREATE INDEX IF NOT EXISTS idx_forum_thread_forum_new_thread_message_id
+        ON forum_thread (forum_new_thread_message_id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_forum_message_forum_feed_message_id
+        ON forum_message (forum_feed_message_id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_forum_message_thread_location_id
+        ON forum_message (thread_location_id)
+        """,
+    ]),
+    (4, "Normalize telegram_messages into the telegram_discord_message mapping table", [
+        """
+        CREATE TABLE IF NOT EXISTS telegram_discord_message (
+            group_id INTEGER,
+            telegram_message_id INTEGER,
+            part_index INTEGER,
+            discord_message_id INTEGER,
+            channel_id INTEGER,
+            datetime TEXT,
+            PRIMARY KEY (group_id, telegram_message_id, part_index)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_telegram_discord_message_discord_message_id
+        ON telegram_discord_message (discord_message_id)
+        """,
+        migrate_telegram_messages,
+        "DROP TABLE telegram_messages",
+    ]),
+    (5, "Add the rendered content hash of the mirrored telegram message parts", [
+        "ALTER TABLE telegram_discord_message ADD COLUMN content_hash TEXT",
+    ]),
+]
+
+
+# Create a new class called DatabaseGateway
+class DatabaseGateway:
+    def __init__(self, path, pragmas=None, read_pool_size=4, timeout=5) -> None:
+        self.path = path
+        self.pragmas = pragmas or {}
+        self.timeout = timeout
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database-writer')
+        self.reader = ThreadPoolExecutor(max_workers=read_pool_size, thread_name_prefix='database-reader')
+        self.write_connection = self._connect()
+        self.read_connections = queue.SimpleQueue()
+        for _ in range(read_pool_size):
+            self.read_connections.put(self._connect())
+
+    """
+    Open a new connection that can be handed over between the executor threads and apply the pragma profile
+    """
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    """
+    Run the write function on the writer thread and commit it as one transaction
+    """
+    def _run_write(self, func, *args):
+        cursor = self.write_connection.cursor()
+        try:
+            # Begin the transaction explicitly so the schema statements are committed atomically too
+            cursor.execute("BEGIN IMMEDIATE")
+            result = func(cursor, *args)
+            self.write_connection.commit()
+            return result
+        except Exception:
+            self.write_connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    """
+    Run the read query on one of the pooled read connections
+    """
+    def _run_read(self, sql, params, fetch):
+        connection = self.read_connections.get()
+        try:
+            cursor = connection.execute(sql, params)
+            return cursor.fetchone() if fetch == 'one' else cursor.fetchall()
+        finally:
+            self.read_connections.put(connection)
+
+    """
+    Await the write function on the writer thread, the function receive the cursor as the first argument
+    """
+    async def run_write(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.writer, self._run_write, func, *args)
+
+    """
+    Execute a single write statement and return the affected row count
+    """
+    async def execute(self, sql, params=()) -> int:
+        return await self.run_write(lambda cursor: cursor.execute(sql, params).rowcount)
+
+    """
+    Execute a write statement for every parameters in the sequence and return the affected row count
+    """
+    async def executemany(self, sql, seq_of_params) -> int:
+        return await self.run_write(lambda cursor: cursor.executemany(sql, seq_of_params).rowcount)
+
+    """
+    Execute the list of (sql, params) statements in one transaction and return the affected row count
+    """
+    async def transaction(self, statements) -> int:
+        def write(cursor):
+            rowcount = 0
+            for sql, params in statements:
+                rowcount += max(cursor.execute(sql, params).rowcount, 0)
+            return rowcount
+
+        return await self.run_write(write)
+
+    """
+    Upsert the rows with INSERT ... ON CONFLICT DO UPDATE through executemany, every batch is committed as one
+    transaction and the upserted row count is returned
+    """
+    async def upsert(self, table, columns, key_columns, rows, update_columns=None, batch_size=500) -> int:
+        if update_columns is None:
+            update_columns = [column for column in columns if column not in key_columns]
+
+        # Build the upsert statement, rows with a conflicting key only update the update columns
+        sql = f"""
+            INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})
+            ON CONFLICT ({', '.join(key_columns)}) DO {
+                'UPDATE SET ' + ', '.join(f'{column} = excluded.{column}' for column in update_columns)
+                if update_columns else 'NOTHING'
+            }
+        """
+
+        rowcount = 0
+        for start in range(0, len(rows), batch_size):
+            rowcount += await self.executemany(sql, rows[start:start + batch_size])
+
+        return rowcount
+
+    """
+    Fetch the first row of the read query
+    """
+    async def fetchone(self, sql, params=()):
+        return await asyncio.get_running_loop().run_in_executor(self.reader, self._run_read, sql, params, 'one')
+
+    """
+    Fetch all rows of the read query
+    """
+    async def fetchall(self, sql, params=()):
+        return await asyncio.get_running_loop().run_in_executor(self.reader, self._run_read, sql, params, 'all')
+
+    """
+    Wait for the pending queries and close every connection
+    """
+    def close(self) -> None:
+        self.writer.shutdown(wait=True)
+        self.reader.shutdown(wait=True)
+        self.write_connection.close()
+        while not self.read_connections.empty():
+            self.read_connections.get().close()
+
+
+# Create a new class called HotIdCache
+class HotIdCache:
+    def __init__(self, gateway, table, key_column, value_column, max_size) -> None:
+        self.gateway = gateway
+        self.table = table
+        self.key_column = key_column
+        self.value_column = value_column
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.complete = True
+
+    """
+    Warm the cache with the newest rows of the table, a miss is only authoritative while the whole table fits
+    """
+    async def warm(self) -> None:
+        rows = await self.gateway.fetchall(
+            f"SELECT {self.key_column}, {self.value_column} FROM {self.table} ORDER BY {self.key_column} DESC LIMIT ?",
+            (self.max_size + 1,)
+        )
+        self.complete = len(rows) <= self.max_size
+        self.entries = OrderedDict(reversed(rows[:self.max_size]))
 
+    """
+    Save the tracked id into the cache and evict the least recently used id when the cache is full
+    """
+    def put(self, key, value=None) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.complete = False
+
+    """
+    Update the value of the tracked id only if the id is already in the cache
+    """
+    def update(self, key, value) -> None:
+        if key in self.entries:
+            self.entries[key] = value
+
+    """
+    Remove the id from the cache after it is deleted from the table
+    """
+    def discard(self, key) -> None:
+        self.entries.pop(key, None)
 
-# Connect to the database
-database = sqlite3.connect('data/data.db')
-cursor = database.cursor()
+    """
+    Get the (value,) row of the tracked id like the gateway fetchone, or None if the id is not tracked,
+    the table is only queried when the cache has evicted ids
+    """
+    async def fetchone(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return (self.entries[key],)
+
+        if self.complete:
+            return None
+
+        row = await self.gateway.fetchone(
+            f"SELECT {self.value_column} FROM {self.table} WHERE {self.key_column} = ?",
+            (key,)
+        )
+        if row:
+            self.put(key, row[0])
+
+        return row
 
 
 # Create a new class called Database
@@ -17,14 +360,30 @@ class Database(commands.Cog, name='Database'):
         self.config = self.client.config
         self.logger = self.client.logger
         self.db_initialization_event = None
-        self.db_lock = None
+        self.gateway = DatabaseGateway('data/data.db', self.config['database_settings']['pragmas'])
+        self.full_sync = self.config['database_settings']['sync_mode'] == 'full'
+        self.batch_size = self.config['database_settings']['batch_size']
+        self.forum_message_cache = HotIdCache(
+            self.gateway, 'forum_message', 'message_id', 'forum_feed_message_id',
+            self.config['database_settings']['hot_id_cache_size']
+        )
+        self.forum_thread_cache = HotIdCache(
+            self.gateway, 'forum_thread', 'thread_id', 'forum_new_thread_message_id',
+            self.config['database_settings']['hot_id_cache_size']
+        )
 
     """
-    Initialize database lock and initialization event
+    Initialize database initialization event
     """
     async def initialize(self) -> None:
         self.db_initialization_event = asyncio.Event()
-        self.db_lock = asyncio.Lock()
+
+    """
+    Close the database gateway when the cog is unloaded
+    """
+    async def cog_unload(self) -> None:
+        self.update_database.cancel()
+        self.gateway.close()
 
     """
     Initialize the existing threads and messages into the database
@@ -34,14 +393,23 @@ class Database(commands.Cog, name='Database'):
         # Wait until the client is ready
         await self.client.wait_until_ready()
 
-        # Initialize the database lock and initialization event
+        # Initialize the database initialization event
         await self.initialize()
 
-        # Create the database if it does not exist
-        await self._create_database_tables()
+        # Create the database if it does not exist and apply the pending schema migrations
+        await self._migrate_database(dry_run=self.config['database_settings']['migration_dry_run'])
+
+        # Stop after the dry run, the schema is not migrated so the sync and the listeners can not use it
+        if self.config['database_settings']['migration_dry_run']:
+            self.logger.warning("Schema migration dry run | Database sync not started, disable migration_dry_run to migrate")
+            return
 
         # Initialize the existing threads and messages into the database
-        await self._initialize_database()
+        await self.sync_database(full=self.full_sync)
+
+        # Warm the hot id caches with the tracked messages and threads
+        await self.forum_message_cache.warm()
+        await self.forum_thread_cache.warm()
 
         # Log the successful initialization of the database
         self.logger.info("Database initialized successfully")
@@ -60,318 +428,168 @@ class Database(commands.Cog, name='Database'):
         # Wait until the database initialization event is set
         await self.db_initialization_event.wait()
 
+        # Sync the newest threads and messages into the database
+        await self.sync_database(full=self.full_sync)
+
+        # Log the database update
+        self.logger.info("Database updated with newest form existing threads and messages")
+
+    """
+    Sync the threads and messages into the database, only messages after the sync_state checkpoint are fetched
+    unless full is set, which rescans the whole history and removes the rows of deleted messages
+    """
+    async def sync_database(self, full=False) -> None:
         # Check if the bot feature for forum new thread message is enabled
         if self.config["bot_feature"]["forum_new_thread_message"]:
             # Add a helper method for forum new thread message periodic update functionality
             await self._update_forum_thread()
-            await self._update_forum_new_thread_message()
+            await self._update_forum_new_thread_message(full)
 
         # Check if the bot feature for forum feed message is enabled
         if self.config["bot_feature"]["forum_feed_message"]:
             # Add a helper method for forum feed message periodic update functionality
-            await self._update_forum_message()
-            await self._update_forum_feed_message()
-
-        # Log the database update
-        self.logger.info("Database updated with newest form existing threads and messages")
+            await self._update_forum_message(full)
+            await self._update_forum_feed_message(full)
 
     """
-    Create the database tables if they do not exist
+    Apply the pending schema migrations in version order and record them in the schema_version table,
+    a dry run only logs the pending migrations without touching the schema
     """
-    async def _create_database_tables(self) -> None:
+    async def _migrate_database(self, dry_run=False) -> None:
         try:
-            # Check if forum new thread message are enabled
-            if self.config["bot_feature"]["forum_new_thread_message"]:
-                # Create the forum_new_thread_message table
-                cursor.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS forum_new_thread_message (
-                        forum_new_thread_message_id INTEGER PRIMARY KEY,
-                        channel_id INTEGER,
-                        created_at TEXT,
-                        edited_at TEXT
-                    )
-                    """
-                )
-
-                # Create the forum_thread table
-                cursor.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS forum_thread (
-                        thread_id INTEGER PRIMARY KEY,
-                        thread_name TEXT,
-                        thread_location_id INTEGER,
-                        thread_location TEXT,
-                        author_id INTEGER,
-                        author_name TEXT,
-                        created_at TEXT,
-                        jump_url TEXT,
-                        member_count INTEGER,
-                        message_count INTEGER,
-                        locked BOOLEAN DEFAULT 0,
-                        archived BOOLEAN DEFAULT 0,
-                        forum_new_thread_message_id INTEGER,
-                        FOREIGN KEY (forum_new_thread_message_id) REFERENCES forum_new_thread_message (forum_new_thread_message_id)
-                    )
-                    """
-                )
-
-            # Check if forum feed message are enabled
-            if self.config["bot_feature"]["forum_feed_message"]:
-                # Create the forum_feed_message table
-                cursor.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS forum_feed_message (
-                        forum_feed_message_id INTEGER PRIMARY KEY,
-                        channel_id INTEGER,
-                        created_at TEXT,
-                        edited_at TEXT
-                    )
-                    """
-                )
-
-                # Create the forum_message table
-                cursor.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS forum_message (
-                        message_id INTEGER PRIMARY KEY,
-                        thread_location_id INTEGER,
-                        author_id INTEGER,
-                        author_name TEXT,
-                        created_at TEXT,
-                        edited_at TEXT,
-                        forum_feed_message_id INTEGER,
-                        FOREIGN KEY (forum_feed_message_id) REFERENCES forum_feed_message (forum_feed_message_id)
-                    )
-                    """
-                )
-
-            # Check if treasury monitoring is enabled
-            if self.config["bot_feature"]["treasury_monitoring"]:
-                # Create treasury_monitoring table
-                cursor.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS treasury_monitoring (
-                        tx_hash TEXT PRIMARY KEY,
-                        value TEXT,
-                        asset TEXT,
-                        from_address TEXT,
-                        to_address TEXT,
-                        timestamp TEXT
-                    )
-                    """
-                )
-
-            # Check if telegram chat mirror is enabled
-            if self.config["bot_feature"]["telegram_chat_mirror"]:
-                # Create the telegram mirror chat table
-                cursor.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS telegram_messages (
-                        message_id INTEGER PRIMARY KEY,
-                        datetime TEXT,
-                        discord_message_id TEXT
-                    )
-                    """
+            # Create the schema_version table and get the applied schema versions
+            await self.gateway.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TEXT
                 )
-
-            # Commit the changes to the database
-            async with self.db_lock:
-                database.commit()
+                """
+            )
+            applied_versions = {row[0] for row in await self.gateway.fetchall("SELECT version FROM schema_version")}
+
+            for version, description, steps in MIGRATIONS:
+                # Skip the migration if it is already applied
+                if version in applied_versions:
+                    continue
+
+                # Log the pending migration without applying it on dry run
+                if dry_run:
+                    self.logger.info(f"Schema migration pending | Version: {version} | {description}")
+                    continue
+
+                statements = []
+                for step in steps:
+                    if callable(step):
+                        # Commit the previous statements before running the batch function until all rows are migrated
+                        await self.gateway.transaction(statements)
+                        statements = []
+                        while await self.gateway.run_write(step, self.batch_size):
+                            pass
+                    else:
+                        statements.append((step, ()))
+
+                # Commit the remaining statements and record the schema version in the same transaction
+                statements.append((
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, str(discord.utils.utcnow()))
+                ))
+                await self.gateway.transaction(statements)
+
+                # Log the applied migration
+                self.logger.info(f"Schema migration applied | Version: {version} | {description}")
+
+            # Log the journal mode used by the database
+            journal_mode = await self.gateway.fetchone("PRAGMA journal_mode")
+            self.logger.info(f"Database schema ready | Journal mode: {journal_mode[0]}")
 
         except sqlite3.Error as e:
-            self.logger.error(f"Database error in _create_database_tables: {e}")
+            self.logger.error(f"Database error in _migrate_database: {e}")
 
         except Exception as e:
-            self.logger.error(f"Exception in Database _create_database_tables | {e}")
+            self.logger.error(f"Exception in Database _migrate_database | {e}")
 
     """
-    Initialize the existing threads and messages into the database
+    Get the last synced message id of every channel and thread in the sync scope
     """
-    async def _initialize_database(self) -> None:
-        try:
-            # Get the source and target channels for forum new thread message and forum feed message
-            forumnewthreadmessage_source_forum_channel = self.client.get_channel(
-                self.config['forum_new_thread_message_settings']['source_forum_channel_id'])
-            forumfeedmessage_source_forum_channel = self.client.get_channel(
-                self.config['forum_feed_message_settings']['source_forum_channel_id'])
-            forumnewthreadmessage_target_channel = self.client.get_channel(
-                self.config['forum_new_thread_message_settings']['target_channel_id'])
-            forumfeedmessage_target_channel = self.client.get_channel(
-                self.config['forum_feed_message_settings']['target_channel_id'])
-
-            # Check if forum new thread message settings are enabled
-            if self.config["bot_feature"]["forum_new_thread_message"]:
-                # Iterate over each ACTIVE thread in the source forum channel and insert it into database
-                active_threads = forumnewthreadmessage_source_forum_channel.threads
-                for thread in tqdm(active_threads, desc="Processing active threads"):
-                    cursor.execute(
-                        "SELECT 1 FROM forum_thread WHERE thread_id = ?",
-                        (thread.id,)
-                    )
-                    if not cursor.fetchone():
-                        cursor.execute(
-                            """
-                            INSERT INTO forum_thread (
-                                thread_id, thread_name, thread_location_id, thread_location, author_id, author_name,
-                                created_at, jump_url, member_count, message_count, locked, archived, 
-                                forum_new_thread_message_id
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                thread.id, thread.name, thread.parent_id,
-                                thread.parent.name if thread.parent else "Unknown", thread.owner_id,
-                                thread.owner.name if thread.owner else "Unknown", thread.created_at, thread.jump_url,
-                                thread.member_count, thread.message_count, thread.locked, thread.archived, None
-                            )
-                        )
-
-                # Iterate over each ARCHIVED thread in the source forum channel and insert it into database
-                archived_threads = forumnewthreadmessage_source_forum_channel.archived_threads(limit=None)
-                async for thread in tqdm_asyncio(archived_threads, desc="Processing archived threads"):
-                    cursor.execute(
-                        "SELECT 1 FROM forum_thread WHERE thread_id = ?",
-                        (thread.id,)
-                    )
-                    if not cursor.fetchone():
-                        cursor.execute(
-                            """
-                            INSERT INTO forum_thread (
-                                thread_id, thread_name, thread_location_id, thread_location, author_id, author_name,
-                                created_at, jump_url, member_count, message_count, locked, archived, 
-                                forum_new_thread_message_id
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                thread.id, thread.name, thread.parent_id,
-                                thread.parent.name if thread.parent else "Unknown", thread.owner_id,
-                                thread.owner.name if thread.owner else "Unknown", thread.created_at, thread.jump_url,
-                                thread.member_count, thread.message_count, thread.locked, thread.archived, None
-                            )
-                        )
+    async def _get_checkpoints(self, scope) -> dict:
+        rows = await self.gateway.fetchall(
+            "SELECT channel_id, last_message_id FROM sync_state WHERE scope = ?",
+            (scope,)
+        )
+        return {channel_id: last_message_id for channel_id, last_message_id in rows}
 
-                # Iterate over each message in the target channel and insert it into database for ForumNewThreadMessage
-                # and update the forum_thread table with the new forum_new_thread_message_id
-                async for message in tqdm_asyncio(
-                        forumnewthreadmessage_target_channel.history(limit=None),
-                        desc="Processing target channel messages for ForumNewThreadMessage"
-                ):
-                    cursor.execute(
-                        "SELECT 1 FROM forum_new_thread_message WHERE forum_new_thread_message_id = ?",
-                        (message.id,)
-                    )
-                    if not cursor.fetchone():
-                        cursor.execute(
-                            """
-                            INSERT INTO forum_new_thread_message (
-                                forum_new_thread_message_id, channel_id, created_at, edited_at
-                            ) VALUES (?, ?, ?, ?)
-                            """,
-                            (message.id, message.channel.id, message.created_at, message.edited_at)
-                        )
-                        cursor.execute(
-                            """
-                            UPDATE forum_thread SET forum_new_thread_message_id = ? WHERE thread_id = ?
-                            """,
-                            (message.id, message.embeds[0].footer.text.split(' ')[-1])
-                        )
+    """
+    Static method to check if the channel has no message newer than the checkpoint
+    """
+    @staticmethod
+    def _is_synced(channel, last_message_id) -> bool:
+        return (
+            last_message_id is not None
+            and channel.last_message_id is not None
+            and channel.last_message_id <= last_message_id
+        )
 
-                # Commit the all changes to the database
-                async with self.db_lock:
-                    database.commit()
-
-            # Check if forum feed message settings are enabled
-            if self.config["bot_feature"]["forum_feed_message"]:
-                # Iterate over each message in ACTIVE SOURCE FORUM CHANNEL THREAD
-                # and IF CONTAINS TRIGGER ROLE ID then insert it into database
-                for thread in tqdm(
-                        forumfeedmessage_source_forum_channel.threads,
-                        desc="Processing message containing trigger role in active threads"
-                ):
-                    async for message in thread.history(limit=None):
-                        if self.config['forum_feed_message_settings']['trigger_role_id'] in message.raw_role_mentions:
-                            cursor.execute(
-                                "SELECT 1 FROM forum_message WHERE message_id = ?",
-                                (message.id,)
-                            )
-                            if not cursor.fetchone():
-                                cursor.execute(
-                                    """
-                                    INSERT INTO forum_message (
-                                        message_id, thread_location_id, author_id, author_name, created_at, edited_at,
-                                        forum_feed_message_id
-                                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                                    """,
-                                    (
-                                        message.id, thread.id, message.author.id,
-                                        message.author.name if message.author else "Unknown",
-                                        message.created_at, message.edited_at, None
-                                    )
-                                )
-
-                # Iterate over each message in ARCHIVED SOURCE FORUM CHANNEL THREAD
-                # and IF CONTAINS TRIGGER ROLE ID then insert it into database
-                async for thread in tqdm_asyncio(
-                        forumfeedmessage_source_forum_channel.archived_threads(limit=None),
-                        desc="Processing message containing trigger role in archived threads"
-                ):
-                    async for message in thread.history(limit=None):
-                        if self.config['forum_feed_message_settings']['trigger_role_id'] in message.raw_role_mentions:
-                            cursor.execute(
-                                "SELECT 1 FROM forum_message WHERE message_id = ?",
-                                (message.id,)
-                            )
-                            if not cursor.fetchone():
-                                cursor.execute(
-                                    """
-                                    INSERT INTO forum_message (
-                                        message_id, thread_location_id, author_id, author_name, created_at, edited_at,
-                                        forum_feed_message_id
-                                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                                    """,
-                                    (
-                                        message.id, thread.id, message.author.id,
-                                        message.author.name if message.author else "Unknown",
-                                        message.created_at, message.edited_at, None
-                                    )
-                                )
-
-                # Iterate over each message in the target channel and insert it into database for ForumFeedMessage
-                async for message in tqdm_asyncio(
-                        forumfeedmessage_target_channel.history(limit=None),
-                        desc="Processing target channel messages for ForumFeedMessage"
-                ):
-                    cursor.execute(
-                        "SELECT 1 FROM forum_feed_message WHERE forum_feed_message_id = ?",
-                        (message.id,)
-                    )
-                    if not cursor.fetchone():
-                        cursor.execute(
-                            """
-                            INSERT INTO forum_feed_message (forum_feed_message_id, channel_id, created_at, edited_at
-                            ) VALUES (?, ?, ?, ?)
-                            """,
-                            (message.id, message.channel.id, message.created_at, message.edited_at)
-                        )
-                        cursor.execute(
-                            """
-                            UPDATE forum_message SET forum_feed_message_id = ? WHERE message_id = ?
-                            """,
-                            (message.id, message.embeds[0].footer.text.split(' ')[-1])
-                        )
+    """
+    Diff the live rows against the table with a single SELECT, upsert the live rows in batches and delete the missing
+    rows, rows missing from live_rows are only deleted when delete is set because an incremental sync only sees new
+    messages
+    """
+    async def _reconcile(
+            self, table, key_column, columns, live_rows, update_columns=None, link_sql=None, delete=True,
+            checkpoints=None, cache=None, link_cache=None
+    ) -> tuple:
+        # Get the stored ids and split the live ids into inserted, updated and deleted ids
+        stored_ids = {row[0] for row in await self.gateway.fetchall(f"SELECT {key_column} FROM {table}")}
+        inserted = len(live_rows.keys() - stored_ids)
+        updated = len(live_rows.keys() & stored_ids)
+        deletes = [(row_id,) for row_id in stored_ids - live_rows.keys()] if delete else []
+        links = [link for _, link in live_rows.values() if link is not None]
+        synced_at = str(discord.utils.utcnow())
+
+        # Upsert the live rows, every batch is committed as one transaction
+        await self.gateway.upsert(
+            table, columns, [key_column], [row for row, _ in live_rows.values()], update_columns, self.batch_size
+        )
+
+        # Apply the links, deletes and the new checkpoints in one transaction after the rows are saved
+        def write(cursor):
+            if link_sql:
+                cursor.executemany(link_sql, links)
+            cursor.executemany(f"DELETE FROM {table} WHERE {key_column} = ?", deletes)
+            cursor.executemany(
+                """
+                INSERT INTO sync_state (scope, channel_id, last_message_id, synced_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (scope, channel_id) DO UPDATE SET
+                    last_message_id = excluded.last_message_id, synced_at = excluded.synced_at
+                """,
+                [(table, channel_id, last_message_id, synced_at) for channel_id, last_message_id in (checkpoints or {}).items()]
+            )
 
-                # Commit the all changes to the database
-                async with self.db_lock:
-                    database.commit()
+        await self.gateway.run_write(write)
 
-            # Log the database initialization
-            self.logger.info("Database initialized with threads and messages from the source forum and target channel")
+        # Keep the hot id caches coherent with the saved rows
+        if cache:
+            for row_id in live_rows.keys() - stored_ids:
+                cache.put(row_id)
+            for row_id, in deletes:
+                cache.discard(row_id)
+        if link_cache:
+            for value, key in links:
+                link_cache.update(key, value)
 
-        except sqlite3.Error as e:
-            self.logger.error(f"Database error in _initialize_database: {e}")
+        return inserted, updated, len(deletes)
 
-        except Exception as e:
-            self.logger.error(f"Exception in Database _initialize_database | {e}")
+    """
+    Static method to get the source message id from the feed message embed footer
+    """
+    @staticmethod
+    def _footer_message_id(message):
+        if message.embeds and message.embeds[0].footer.text:
+            footer_id = message.embeds[0].footer.text.split(' ')[-1]
+            return int(footer_id) if footer_id.isdigit() else None
+        return None
 
     """
     Update the forum_thread table with the newest threads from the source forum channel
@@ -383,51 +601,36 @@ class Database(commands.Cog, name='Database'):
                 self.config['forum_new_thread_message_settings']['source_forum_channel_id']
             )
 
-            # Iterate over each ACTIVE thread in the source forum channel and update it into the database
-            for thread in update_forum_thread_source_forum_channel.threads:
-                cursor.execute(
-                    "SELECT 1 FROM forum_thread WHERE thread_id = ?",
-                    (thread.id,)
+            # Fetch the ACTIVE and ARCHIVED threads in the source forum channel once
+            live_threads = {thread.id: thread for thread in update_forum_thread_source_forum_channel.threads}
+            async for thread in update_forum_thread_source_forum_channel.archived_threads(limit=None):
+                live_threads.setdefault(thread.id, thread)
+
+            live_rows = {}
+            for thread in live_threads.values():
+                thread_location = thread.parent.name if thread.parent else "Unknown"
+                author_name = thread.owner.name if thread.owner else "Unknown"
+                live_rows[thread.id] = (
+                    (
+                        thread.id, thread.name, thread.parent_id, thread_location, thread.owner_id, author_name,
+                        thread.created_at, thread.jump_url, thread.member_count, thread.message_count,
+                        thread.locked, thread.archived
+                    ),
+                    None
                 )
-                if cursor.fetchone():
-                    cursor.execute(
-                        """
-                        UPDATE forum_thread SET
-                            thread_name = ?, thread_location_id = ?, thread_location = ?, author_id = ?, 
-                            author_name = ?, created_at = ?, jump_url = ?, member_count = ?, message_count = ?, 
-                            locked = ?, archived = ?
-                        WHERE thread_id = ?
-                        """,
-                        (
-                            thread.name, thread.parent_id, thread.parent.name if thread.parent else "Unknown",
-                            thread.owner_id, thread.owner.name if thread.owner else "Unknown",
-                            thread.created_at, thread.jump_url, thread.member_count, thread.message_count,
-                            thread.locked, thread.archived, thread.id
-                        )
-                    )
 
-                    # Commit the all changes to the database
-                    async with self.db_lock:
-                        database.commit()
-
-            # Iterate over thread_id in the forum_thread table and check if the thread still exists as
-            # ACTIVE THREAD and ARCHIVED THREAD in the source forum channel, if not then delete it from the database
-            cursor.execute(
-                "SELECT thread_id FROM forum_thread"
+            # Reconcile the forum_thread table with the live threads
+            inserted, updated, deleted = await self._reconcile(
+                'forum_thread', 'thread_id',
+                [
+                    'thread_id', 'thread_name', 'thread_location_id', 'thread_location', 'author_id', 'author_name',
+                    'created_at', 'jump_url', 'member_count', 'message_count', 'locked', 'archived'
+                ],
+                live_rows,
+                cache=self.forum_thread_cache
             )
-            for thread_id in cursor.fetchall():
-                if (
-                        thread_id[0] not in [thread.id for thread in update_forum_thread_source_forum_channel.threads]
-                        and thread_id[0] not in [thread.id async for thread in update_forum_thread_source_forum_channel.archived_threads()]
-                ):
-                    cursor.execute(
-                        "DELETE FROM forum_thread WHERE thread_id = ?",
-                        (thread_id[0],)
-                    )
 
-                    # Commit the all changes to the database
-                    async with self.db_lock:
-                        database.commit()
+            self.logger.info(f"forum_thread reconciled | Inserted: {inserted}, Updated: {updated}, Deleted: {deleted}")
 
         except sqlite3.Error as e:
             self.logger.error(f"Database error in _update_forum_thread: {e}")
@@ -438,50 +641,47 @@ class Database(commands.Cog, name='Database'):
     """
     Update the forum_new_thread_message table with the newest messages from the target channel
     """
-    async def _update_forum_new_thread_message(self) -> None:
+    async def _update_forum_new_thread_message(self, full=False) -> None:
         try:
-            # Get the target channel
+            # Get the target channel and the last synced message id of the target channel
             update_forum_new_thread_message_target_channel = self.client.get_channel(
                 self.config['forum_new_thread_message_settings']['target_channel_id']
             )
-
-            # Iterate over each message in the target channel and update it into the database
-            async for message in update_forum_new_thread_message_target_channel.history(limit=None):
-                cursor.execute(
-                    "SELECT 1 FROM forum_new_thread_message WHERE forum_new_thread_message_id = ?",
-                    (message.id,)
+            checkpoints = {} if full else await self._get_checkpoints('forum_new_thread_message')
+            last_message_id = checkpoints.get(update_forum_new_thread_message_target_channel.id)
+
+            # Skip the target channel if there is no new message since the last sync
+            if self._is_synced(update_forum_new_thread_message_target_channel, last_message_id):
+                return
+
+            # Fetch the messages in the target channel after the last synced message once
+            live_rows = {}
+            async for message in tqdm_asyncio(
+                    update_forum_new_thread_message_target_channel.history(
+                        limit=None, after=discord.Object(id=last_message_id) if last_message_id else None
+                    ),
+                    desc="Processing target channel messages for ForumNewThreadMessage"
+            ):
+                thread_id = self._footer_message_id(message)
+                live_rows[message.id] = (
+                    (message.id, message.channel.id, message.created_at, message.edited_at),
+                    (message.id, thread_id) if thread_id else None
                 )
-                if cursor.fetchone():
-                    cursor.execute(
-                        """
-                        UPDATE forum_new_thread_message SET 
-                            channel_id = ?, created_at = ?, edited_at = ?
-                        WHERE forum_new_thread_message_id = ?
-                        """,
-                        (message.channel.id, message.created_at, message.edited_at, message.id)
-                    )
-
-                    # Commit the all changes to the database
-                    async with self.db_lock:
-                        database.commit()
-
-            # Iterate over forum_new_thread_message_id in the forum_new_thread_message table and check if the message
-            # still exists in the target channel, if not then delete it from the database
-            cursor.execute(
-                "SELECT forum_new_thread_message_id FROM forum_new_thread_message"
+
+            # Reconcile the forum_new_thread_message table with the live messages
+            inserted, updated, deleted = await self._reconcile(
+                'forum_new_thread_message', 'forum_new_thread_message_id',
+                ['forum_new_thread_message_id', 'channel_id', 'created_at', 'edited_at'],
+                live_rows,
+                link_sql="UPDATE forum_thread SET forum_new_thread_message_id = ? WHERE thread_id = ?",
+                link_cache=self.forum_thread_cache,
+                delete=last_message_id is None,
+                checkpoints={update_forum_new_thread_message_target_channel.id: max(live_rows)} if live_rows else None
+            )
+
+            self.logger.info(
+                f"forum_new_thread_message reconciled | Inserted: {inserted}, Updated: {updated}, Deleted: {deleted}"
             )
-            for forum_new_thread_message_id in cursor.fetchall():
-                if forum_new_thread_message_id[0] not in [
-                    message.id async for message in update_forum_new_thread_message_target_channel.history()
-                ]:
-                    cursor.execute(
-                        "DELETE FROM forum_new_thread_message WHERE forum_new_thread_message_id = ?",
-                        (forum_new_thread_message_id[0],)
-                    )
-
-                    # Commit the all changes to the database
-                    async with self.db_lock:
-                        database.commit()
 
         except sqlite3.Error as e:
             self.logger.error(f"Database error in _update_forum_new_thread_message: {e}")
@@ -490,63 +690,53 @@ class Database(commands.Cog, name='Database'):
             self.logger.error(f"Exception in Database _update_forum_new_thread_message: {e}")
 
     """
-    Update the forum_message table with the newest messages from the target channel
+    Update the forum_message table with the newest messages from the source forum channel
     """
-    async def _update_forum_message(self) -> None:
+    async def _update_forum_message(self, full=False) -> None:
         try:
-            # Get the source forum channel
+            # Get the source forum channel and the last synced message id of every thread
             update_forum_message_source_forum_channel = self.client.get_channel(
                 self.config['forum_feed_message_settings']['source_forum_channel_id']
             )
-
-            # Iterate over each ACTIVE SOURCE FORUM CHANNEL THREAD and IF CONTAINS TRIGGER ROLE ID
-            # then update it into database
-            for thread in update_forum_message_source_forum_channel.threads:
-                async for message in thread.history(limit=None):
+            checkpoints = {} if full else await self._get_checkpoints('forum_message')
+
+            # Get the ACTIVE and ARCHIVED threads that have new messages since the last sync
+            threads = list(update_forum_message_source_forum_channel.threads)
+            async for thread in update_forum_message_source_forum_channel.archived_threads(limit=None):
+                threads.append(thread)
+            threads = [thread for thread in threads if not self._is_synced(thread, checkpoints.get(thread.id))]
+
+            # Fetch the history of every thread after its last synced message once
+            # and keep the messages with trigger role
+            live_rows = {}
+            new_checkpoints = {}
+            for thread in tqdm(threads, desc="Processing message containing trigger role in threads"):
+                last_message_id = checkpoints.get(thread.id)
+                async for message in thread.history(
+                        limit=None, after=discord.Object(id=last_message_id) if last_message_id else None
+                ):
+                    new_checkpoints[thread.id] = max(new_checkpoints.get(thread.id, 0), message.id)
                     if self.config['forum_feed_message_settings']['trigger_role_id'] in message.raw_role_mentions:
-                        cursor.execute(
-                            "SELECT 1 FROM forum_message WHERE message_id = ?",
-                            (message.id,)
+                        author_name = message.author.name if message.author else "Unknown"
+                        live_rows[message.id] = (
+                            (
+                                message.id, thread.id, message.author.id, author_name,
+                                message.created_at, message.edited_at
+                            ),
+                            None
                         )
-                        if cursor.fetchone():
-                            cursor.execute(
-                                """
-                                UPDATE forum_message SET
-                                    thread_location_id = ?, author_id = ?, author_name = ?, created_at = ?, edited_at = ?
-                                WHERE message_id = ?
-                                """,
-                                (
-                                    thread.id, message.author.id, message.author.name if message.author else "Unknown",
-                                    message.created_at, message.edited_at, message.id
-                                )
-                            )
-
-                            # Commit the all changes to the database
-                            async with self.db_lock:
-                                database.commit()
-
-            # Iterate over message_id in the forum_message table and check if the message still exists
-            # in the target channel, if not then delete it from the database
-            forum_message_id = []
-            for thread in update_forum_message_source_forum_channel.threads:
-                async for message in thread.history(limit=None):
-                    forum_message_id.append(message.id)
-            async for thread in update_forum_message_source_forum_channel.archived_threads():
-                async for message in thread.history(limit=None):
-                    forum_message_id.append(message.id)
-            cursor.execute(
-                "SELECT message_id FROM forum_message"
+
+            # Reconcile the forum_message table with the live messages
+            inserted, updated, deleted = await self._reconcile(
+                'forum_message', 'message_id',
+                ['message_id', 'thread_location_id', 'author_id', 'author_name', 'created_at', 'edited_at'],
+                live_rows,
+                delete=not checkpoints,
+                checkpoints=new_checkpoints,
+                cache=self.forum_message_cache
             )
-            for message_id in cursor.fetchall():
-                if message_id[0] not in forum_message_id:
-                    cursor.execute(
-                        "DELETE FROM forum_message WHERE message_id = ?",
-                        (message_id[0],)
-                    )
 
-                    # Commit the all changes to the database
-                    async with self.db_lock:
-                        database.commit()
+            self.logger.info(f"forum_message reconciled | Inserted: {inserted}, Updated: {updated}, Deleted: {deleted}")
 
         except sqlite3.Error as e:
             self.logger.error(f"Database error in _update_forum_message: {e}")
@@ -557,48 +747,47 @@ class Database(commands.Cog, name='Database'):
     """
     Update the forum_feed_message table with the newest messages from the target channel
     """
-    async def _update_forum_feed_message(self) -> None:
+    async def _update_forum_feed_message(self, full=False) -> None:
         try:
-            # Get the target channel
+            # Get the target channel and the last synced message id of the target channel
             update_forum_feed_message_target_channel = self.client.get_channel(
                 self.config['forum_feed_message_settings']['target_channel_id']
             )
-
-            # Iterate over each message in the target channel and update it into the database
-            async for message in update_forum_feed_message_target_channel.history(limit=None):
-                cursor.execute(
-                    "SELECT 1 FROM forum_feed_message WHERE forum_feed_message_id = ?",
-                    (message.id,)
+            checkpoints = {} if full else await self._get_checkpoints('forum_feed_message')
+            last_message_id = checkpoints.get(update_forum_feed_message_target_channel.id)
+
+            # Skip the target channel if there is no new message since the last sync
+            if self._is_synced(update_forum_feed_message_target_channel, last_message_id):
+                return
+
+            # Fetch the messages in the target channel after the last synced message once
+            live_rows = {}
+            async for message in tqdm_asyncio(
+                    update_forum_feed_message_target_channel.history(
+                        limit=None, after=discord.Object(id=last_message_id) if last_message_id else None
+                    ),
+                    desc="Processing target channel messages for ForumFeedMessage"
+            ):
+                message_id = self._footer_message_id(message)
+                live_rows[message.id] = (
+                    (message.id, message.channel.id, message.created_at, message.edited_at),
+                    (message.id, message_id) if message_id else None
                 )
-                if cursor.fetchone():
-                    cursor.execute(
-                        """
-                        UPDATE forum_feed_message SET 
-                            channel_id = ?, created_at = ?, edited_at = ?
-                        WHERE forum_feed_message_id = ?
-                        """,
-                        (message.channel.id, message.created_at, message.edited_at, message.id)
-                    )
-
-                    # Commit the all changes to the database
-                    async with self.db_lock:
-                        database.commit()
-
-            # Iterate over forum_feed_message_id in the forum_feed_message table and check if the message still exists
-            # in the target channel, if not then delete it from the database
-            cursor.execute(
-                "SELECT forum_feed_message_id FROM forum_feed_message"
+
+            # Reconcile the forum_feed_message table with the live messages
+            inserted, updated, deleted = await self._reconcile(
+                'forum_feed_message', 'forum_feed_message_id',
+                ['forum_feed_message_id', 'channel_id', 'created_at', 'edited_at'],
+                live_rows,
+                link_sql="UPDATE forum_message SET forum_feed_message_id = ? WHERE message_id = ?",
+                link_cache=self.forum_message_cache,
+                delete=last_message_id is None,
+                checkpoints={update_forum_feed_message_target_channel.id: max(live_rows)} if live_rows else None
+            )
+
+            self.logger.info(
+                f"forum_feed_message reconciled | Inserted: {inserted}, Updated: {updated}, Deleted: {deleted}"
             )
-            for forum_feed_message_id in cursor.fetchall():
-                if forum_feed_message_id[0] not in [message.id async for message in update_forum_feed_message_target_channel.history()]:
-                    cursor.execute(
-                        "DELETE FROM forum_feed_message WHERE forum_feed_message_id = ?",
-                        (forum_feed_message_id[0],)
-                    )
-
-                    # Commit the all changes to the database
-                    async with self.db_lock:
-                        database.commit()
 
         except sqlite3.Error as e:
             self.logger.error(f"Database error in _update_forum_feed_message: {e}")
@@ -0,0 +1,209 @@
+import discord
+from discord.ext import commands, tasks
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import itertools
+import asyncio
+
+
+# Priorities of the outbound jobs, the lower value is delivered first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Discord only bulk deletes up to 100 messages per request that are younger than 14 days
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+
+
+# Create a new class called OutboundJob
+class OutboundJob:
+    def __init__(self, action, channel, message_id, key, kwargs) -> None:
+        self.action = action
+        self.channel = channel
+        self.message_id = message_id
+        self.key = key
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class DiscordOutbox(commands.Cog, name='Discord Outbox'):
+    def __init__(self, client) -> None:
+        self.client = client
+        self.config = self.client.config
+        self.logger = self.client.logger
+        self.max_retries = self.config['discord_outbox_settings']['max_retries']
+        self.queues = {}
+        self.workers = {}
+        self.pending_jobs = {}
+        self.sequence = itertools.count()
+        self.counters = Counter()
+        self.log_queue_metrics.start()
+
+    """
+    Stop the workers and the queue metrics log when the cog is unloaded
+    """
+    async def cog_unload(self) -> None:
+        self.log_queue_metrics.cancel()
+        for worker in self.workers.values():
+            worker.cancel()
+
+    """
+    Queue a message to be sent to the channel, the key lets a later edit be merged into the pending send
+    """
+    async def send(self, channel, key=None, priority=PRIORITY_NORMAL, **kwargs):
+        return await self._enqueue(OutboundJob('send', channel, None, key, kwargs), priority)
+
+    """
+    Queue an edit of the message in the channel, the edit is merged into the pending send or edit with the same key
+    """
+    async def edit(self, channel, message_id, key=None, priority=PRIORITY_NORMAL, **kwargs):
+        return await self._enqueue(OutboundJob('edit', channel, message_id, key or message_id, kwargs), priority)
+
+    """
+    Queue a delete of the message in the channel
+    """
+    async def delete(self, channel, message_id, priority=PRIORITY_NORMAL):
+        return await self._enqueue(OutboundJob('delete', channel, message_id, None, {}), priority)
+
+    """
+    Queue a delete of many messages in the channel, the messages younger than 14 days are deleted with bulk deletes of
+    up to 100 messages and the older messages are deleted one by one
+    """
+    async def delete_many(self, channel, message_ids, priority=PRIORITY_NORMAL):
+        bulk_deletable_after = datetime.now(timezone.utc) - BULK_DELETE_MAX_AGE + timedelta(minutes=1)
+        recent_message_ids = []
+        old_message_ids = []
+        for message_id in message_ids:
+            if discord.utils.snowflake_time(message_id) > bulk_deletable_after:
+                recent_message_ids.append(message_id)
+            else:
+                old_message_ids.append(message_id)
+
+        futures = [
+            self._enqueue(OutboundJob('bulk_delete', channel, None, None, {'message_ids': recent_message_ids[index:index + BULK_DELETE_LIMIT]}), priority)
+            for index in range(0, len(recent_message_ids), BULK_DELETE_LIMIT)
+        ]
+        futures.extend(
+            self._enqueue(OutboundJob('delete', channel, message_id, None, {}), priority) for message_id in old_message_ids
+        )
+
+        # Wait for every delete before raising the first failure, so one failed job does not hide the others
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    """
+    Get the number of queued jobs of every channel
+    """
+    def queue_depths(self) -> dict:
+        return {channel_id: queue.qsize() for channel_id, queue in self.queues.items()}
+
+    """
+    Put the job into the priority queue of the channel and start the channel worker if it is not running yet
+    """
+    def _enqueue(self, job, priority) -> asyncio.Future:
+        pending_key = (job.channel.id, job.key)
+
+        # Merge the edit into the pending send or edit of the same message
+        if job.action == 'edit' and pending_key in self.pending_jobs:
+            pending_job = self.pending_jobs[pending_key]
+            pending_job.kwargs.update(job.kwargs)
+            self.counters['coalesced'] += 1
+            return pending_job.future
+
+        # Skip the edit of the message that is not sent yet and has no pending send to merge into
+        if job.action == 'edit' and job.message_id is None:
+            self.counters['skipped'] += 1
+            job.future.set_result(None)
+            return job.future
+
+        if job.key is not None:
+            self.pending_jobs[pending_key] = job
+
+        if job.channel.id not in self.queues:
+            self.queues[job.channel.id] = asyncio.PriorityQueue()
+            self.workers[job.channel.id] = asyncio.create_task(self._worker(self.queues[job.channel.id]))
+
+        self.queues[job.channel.id].put_nowait((priority, next(self.sequence), job))
+        return job.future
+
+    """
+    Deliver the queued jobs of the channel one by one, so the bursts are drained at the rate limit of the channel
+    """
+    async def _worker(self, queue) -> None:
+        while True:
+            priority, sequence, job = await queue.get()
+
+            # Stop merging the edits into the job once it is being delivered
+            if self.pending_jobs.get((job.channel.id, job.key)) is job:
+                del self.pending_jobs[(job.channel.id, job.key)]
+
+            try:
+                result = await self._deliver(job)
+                self.counters[job.action] += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as e:
+                self.counters['failed'] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                queue.task_done()
+
+    """
+    Deliver the job to discord, retry it when discord has server error, the rate limits are waited out by discord.py
+    while the channel worker holds the next jobs back
+    """
+    async def _deliver(self, job):
+        for attempt in range(self.max_retries + 1):
+            # Rewind the files that were read by the failed attempt, discord.py only rewinds them on its own retries
+            if attempt:
+                for file in [*job.kwargs.get('files', []), *filter(None, [job.kwargs.get('file')])]:
+                    file.reset()
+
+            try:
+                if job.action == 'send':
+                    return await job.channel.send(**job.kwargs)
+                elif job.action == 'edit':
+                    return await job.channel.get_partial_message(job.message_id).edit(**job.kwargs)
+                elif job.action == 'bulk_delete':
+                    return await job.channel.delete_messages([discord.Object(id=message_id) for message_id in job.kwargs['message_ids']])
+                else:
+                    return await job.channel.get_partial_message(job.message_id).delete()
+            except discord.NotFound:
+                # The message is already deleted, so the delete is done
+                if job.action in ('delete', 'bulk_delete'):
+                    return None
+                raise
+            except discord.DiscordServerError:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+            self.counters['retried'] += 1
+            self.logger.warning(f"Outbound {job.action} retried | Channel ID: {job.channel.id} | Attempt: {attempt + 1}")
+
+    """
+    Log the queue depths and the outbound counters every 15 minutes
+    """
+    @tasks.loop(minutes=15)
+    async def log_queue_metrics(self) -> None:
+        queue_depths = self.queue_depths()
+        if queue_depths or self.counters:
+            self.logger.info(
+                f"Discord outbox metrics | Queue depths: {queue_depths} | "
+                + ", ".join(f"{name}: {count}" for name, count in sorted(self.counters.items()))
+            )
+
+    """
+    Make sure the log_queue_metrics task waits until the client is ready before starting
+    """
+    @log_queue_metrics.before_loop
+    async def before_log_queue_metrics(self) -> None:
+        await self.client.wait_until_ready()
+
+
+async def setup(client) -> None:
+    await client.add_cog(DiscordOutbox(client))
@@ -0,0 +1,125 @@
+from discord.ext import commands, tasks
+from collections import Counter, defaultdict
+import time
+
+
+class EventRouter(commands.Cog, name='Event Router'):
+    def __init__(self, client) -> None:
+        self.client = client
+        self.config = self.client.config
+        self.logger = self.client.logger
+        self.max_events_per_second = self.config['event_router_settings']['max_events_per_second']
+        self.channel_routes = defaultdict(set)
+        self.parent_routes = defaultdict(set)
+        self.message_routes = defaultdict(set)
+        self.route_counters = Counter()
+        self.route_windows = {}
+        self.log_route_counters.start()
+
+    """
+    Stop the route counters log when the cog is unloaded
+    """
+    async def cog_unload(self) -> None:
+        self.log_route_counters.cancel()
+
+    """
+    Subscribe the route to the raw events of the channels, the threads under the parent channels, and the messages,
+    the route is dispatched as on_<route> event with the raw event payload
+    """
+    def subscribe(self, route, channel_ids=(), parent_ids=(), message_ids=()) -> None:
+        for channel_id in channel_ids:
+            self.channel_routes[channel_id].add(route)
+        for parent_id in parent_ids:
+            self.parent_routes[parent_id].add(route)
+        for message_id in message_ids:
+            self.message_routes[message_id].add(route)
+
+    """
+    Unsubscribe the route from the messages
+    """
+    def unsubscribe_messages(self, route, message_ids) -> None:
+        for message_id in message_ids:
+            routes = self.message_routes.get(message_id)
+            if routes:
+                routes.discard(route)
+                if not routes:
+                    del self.message_routes[message_id]
+
+    """
+    Get the routes that own the channel, the parent channel, or the message of the raw event
+    """
+    def _resolve_routes(self, channel_id, message_id) -> set:
+        routes = set()
+        if channel_id in self.channel_routes:
+            routes |= self.channel_routes[channel_id]
+        if message_id in self.message_routes:
+            routes |= self.message_routes[message_id]
+        if self.parent_routes:
+            parent_id = getattr(self.client.get_channel(channel_id), 'parent_id', None)
+            if parent_id in self.parent_routes:
+                routes |= self.parent_routes[parent_id]
+        return routes
+
+    """
+    Check if the route is still under the events per second limit, the events above the limit are shed
+    """
+    def _allow(self, route) -> bool:
+        window = int(time.monotonic())
+        window_start, count = self.route_windows.get(route, (window, 0))
+        if window_start != window:
+            window_start, count = window, 0
+
+        self.route_windows[route] = (window_start, count + 1)
+        return count < self.max_events_per_second
+
+    """
+    Dispatch the raw event once to every route that own it and count the routed, shed and dropped events, only the
+    edits are shed because a later edit carries the newest content while a shed delete would be lost for good
+    """
+    def _dispatch(self, event, channel_id, message_id, payload, sheddable=False) -> None:
+        routes = self._resolve_routes(channel_id, message_id)
+        if not routes:
+            self.route_counters[f"{event}.dropped"] += 1
+            return
+
+        for route in routes:
+            if not sheddable or self._allow(route):
+                self.route_counters[route] += 1
+                self.client.dispatch(route, payload)
+            else:
+                self.route_counters[f"{route}.shed"] += 1
+
+    """
+    Route the raw message edit event to the interested cogs
+    """
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload) -> None:
+        self._dispatch('raw_message_edit', payload.channel_id, payload.message_id, payload, sheddable=True)
+
+    """
+    Route the raw message delete event to the interested cogs
+    """
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload) -> None:
+        self._dispatch('raw_message_delete', payload.channel_id, payload.message_id, payload)
+
+    """
+    Log the route counters every 15 minutes
+    """
+    @tasks.loop(minutes=15)
+    async def log_route_counters(self) -> None:
+        if self.route_counters:
+            self.logger.info(
+                "Event router counters | " + ", ".join(f"{route}: {count}" for route, count in sorted(self.route_counters.items()))
+            )
+
+    """
+    Make sure the log_route_counters task waits until the client is ready before starting
+    """
+    @log_route_counters.before_loop
+    async def before_log_route_counters(self) -> None:
+        await self.client.wait_until_ready()
+
+
+async def setup(client) -> None:
+    await client.add_cog(EventRouter(client))
@@ -1,11 +1,8 @@
 import discord
 from discord.ext import commands
 from datetime import datetime, timedelta
-import sqlite3
-
-
-database = sqlite3.connect('data/data.db', timeout=5)
-cursor = database.cursor()
+from cogs.discord_outbox import PRIORITY_LOW
+import asyncio
 
 
 class ForumFeedMessage(commands.Cog, name='Forum Feed Message'):
@@ -13,26 +10,73 @@ class ForumFeedMessage(commands.Cog, name='Forum Feed Message'):
         self.client = client
         self.config = self.client.config
         self.logger = self.client.logger
+        self.source_forum_channel_id = self.config['forum_feed_message_settings']['source_forum_channel_id']
+        self.trigger_role_id = self.config['forum_feed_message_settings']['trigger_role_id']
+        self.trigger_role_mention = str(self.trigger_role_id)
+        self.source_thread_ids = set()
+        self.edit_quiet_window = self.config['forum_feed_message_settings']['edit_quiet_window']
+        self.pending_edits = {}
+        self.saving_feed_messages = {}
+
+    """
+    Precompute the thread ids under the source forum channel and subscribe the source forum channel edits and deletes to
+    the event router
+    """
+    @commands.Cog.listener()
+    async def on_ready(self) -> None:
+        source_forum_channel = self.client.get_channel(self.source_forum_channel_id)
+        if source_forum_channel:
+            self.source_thread_ids.update(thread.id for thread in source_forum_channel.threads)
+
+        for route in ('forum_feed_message_edit', 'forum_feed_message_delete'):
+            self.client.get_cog('Event Router').subscribe(
+                route, channel_ids=self.source_thread_ids, parent_ids=(self.source_forum_channel_id,)
+            )
+
+    """
+    Check if the channel is a thread under the source forum channel using only the precomputed ids and client cache
+    """
+    def is_source_thread(self, channel_id) -> bool:
+        if channel_id in self.source_thread_ids:
+            return True
+
+        if getattr(self.client.get_channel(channel_id), 'parent_id', None) == self.source_forum_channel_id:
+            self.source_thread_ids.add(channel_id)
+            return True
+
+        return False
 
     """
     Send feed message to target channel when trigger role get mentioned in message at source forum channel
     """
     @commands.Cog.listener()
     async def on_message(self, message) -> None:
-        await self.client.get_cog('Database').db_initialization_event.wait()
+        # Ignore the message if it is not in the source forum channel or the trigger role is not mentioned
+        if self.trigger_role_id not in message.raw_role_mentions or not self.is_source_thread(message.channel.id):
+            return
 
+        # Let the edits of the message wait until its feed message is sent and saved
+        saving_event = self.saving_feed_messages[message.id] = asyncio.Event()
         try:
-            cursor.execute(
-                "SELECT 1 FROM forum_message WHERE message_id = ?",
-                (message.id,)
-            )
+            await self._send_feed_message(message)
+        finally:
+            del self.saving_feed_messages[message.id]
+            saving_event.set()
 
-            # Check if the message is from source forum channel, trigger role is mentioned, and the message is not in the database
-            if (
-                    message.channel.parent.id == self.config['forum_feed_message_settings']['source_forum_channel_id']
-                    and self.config['forum_feed_message_settings']['trigger_role_id'] in message.raw_role_mentions
-                    and cursor.fetchone() is None
-            ):
+    """
+    Helper method for send the feed message of the forum message and save it to the database
+    """
+    async def _send_feed_message(self, message) -> None:
+        await self.client.get_cog('Database').db_initialization_event.wait()
+
+        gateway = self.client.get_cog('Database').gateway
+        forum_message_cache = self.client.get_cog('Database').forum_message_cache
+        outbox = self.client.get_cog('Discord Outbox')
+        statements = []
+
+        try:
+            # Check if the message is not in the database
+            if await forum_message_cache.fetchone(message.id) is None:
                 # Get the target channel and feed message content
                 target_channel = self.client.get_channel(self.config['forum_feed_message_settings']['target_channel_id'])
                 feed_message_content = f"{self.client.config['forum_feed_message_settings']['feed_message']}"
@@ -44,14 +88,16 @@ class ForumFeedMessage(commands.Cog, name='Forum Feed Message'):
                 embed.set_author(name=message.author.name, icon_url=message.author.avatar)
                 embed.set_footer(text=str(message.id))
 
-                # Send forum feed message to target channel
-                new_feed_message = await target_channel.send(
-                    feed_message_content.format(mention=self.config['forum_feed_message_settings']['mention_role_id'], message=message.channel.name),
+                # Send forum feed message to target channel, keyed by the forum message so an edit can be merged into it
+                new_feed_message = await outbox.send(
+                    target_channel,
+                    key=message.id,
+                    content=feed_message_content.format(mention=self.config['forum_feed_message_settings']['mention_role_id'], message=message.channel.name),
                     embed=embed
                 )
 
                 # Save the forum message and forum feed message to database
-                cursor.execute(
+                statements.append((
                     """
                     INSERT INTO forum_message (
                         message_id, thread_location_id, author_id, author_name, created_at, edited_at, 
@@ -62,8 +108,8 @@ class ForumFeedMessage(commands.Cog, name='Forum Feed Message'):
                         message.id, message.channel.id, message.author.id, message.author.name,
                         message.created_at, message.edited_at, new_feed_message.id
                     )
-                )
-                cursor.execute(
+                ))
+                statements.append((
                     """
                     INSERT INTO forum_feed_message (
                         forum_feed_message_id, channel_id, created_at, edited_at
@@ -73,11 +119,11 @@ class ForumFeedMessage(commands.Cog, name='Forum Feed Message'):
                         new_feed_message.id, new_feed_message.channel.id, new_feed_message.created_at,
                         new_feed_message.edited_at
                     )
-                )
+                ))
 
                 # Commit the all changes to the database
-                async with self.client.get_cog('Database').db_lock:
-                    database.commit()
+                await gateway.transaction(statements)
+                forum_message_cache.put(message.id, new_feed_message.id)
 
                 # Log the forum feed message sent
                 self.logger.info(f"Trigger role detected | Message ID: {message.id} | Forum feed message sent")
@@ -85,28 +131,91 @@ class ForumFeedMessage(commands.Cog, name='Forum Feed Message'):
             self.logger.error(f"Message ID: {message.id} | Forum feed message not sent | {e}")
 
     """
-    Update feed message on target channel when message at source forum channel get edited with added trigger role
+    Wait until the message at source forum channel stop getting edited for the quiet window, so only the latest edit
+    of the rapid edits is mirrored to the feed message
     """
     @commands.Cog.listener()
-    async def on_raw_message_edit(self, payload) -> None:
+    async def on_forum_feed_message_edit(self, payload) -> None:
+        # Ignore the edit if the payload has no role mentions, the event router only routes source forum channel edits
+        if 'mention_roles' not in payload.data:
+            return
+
+        # Replace the pending edit with the latest edit if the message is already waiting for the quiet window
+        loop = asyncio.get_running_loop()
+        waiting = payload.message_id in self.pending_edits
+        self.pending_edits[payload.message_id] = (payload, loop.time() + self.edit_quiet_window)
+        if waiting:
+            return
+
+        # Sleep until the quiet window of the latest edit is passed
+        while (delay := self.pending_edits[payload.message_id][1] - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+        await self._update_feed_message(self.pending_edits.pop(payload.message_id)[0])
+
+    """
+    Helper method for build the forum feed embed from the edit payload, the forum message is only fetched when the
+    payload or the client cache is missing the fields of the embed
+    """
+    async def _build_feed_embed(self, payload):
+        thread = self.client.get_channel(payload.channel_id)
+        author = self.client.get_user(int(payload.data['author']['id'])) if 'author' in payload.data else None
+
+        if thread is not None and author is not None and 'content' in payload.data and 'attachments' in payload.data:
+            jump_url = thread.get_partial_message(payload.message_id).jump_url
+            content = payload.data['content']
+            image_url = payload.data['attachments'][0]['url'] if payload.data['attachments'] else None
+        else:
+            thread = thread or await self.client.fetch_channel(payload.channel_id)
+            forum_message = await thread.fetch_message(payload.message_id)
+            author = forum_message.author
+            jump_url = forum_message.jump_url
+            content = forum_message.content
+            image_url = forum_message.attachments[0].url if forum_message.attachments else None
+
+        # Setups the embed message for forum feed message
+        embed = discord.Embed(title=f"{jump_url}", description=f"{content}", color=discord.Color.yellow())
+        if image_url:
+            embed.set_image(url=image_url)
+        embed.set_author(name=author.name, icon_url=author.avatar)
+        embed.set_footer(text=str(payload.message_id))
+
+        return embed, thread.name
+
+    """
+    Update feed message on target channel when message at source forum channel get edited with added trigger role
+    """
+    async def _update_feed_message(self, payload) -> None:
         await self.client.get_cog('Database').db_initialization_event.wait()
 
+        gateway = self.client.get_cog('Database').gateway
+        forum_message_cache = self.client.get_cog('Database').forum_message_cache
+        outbox = self.client.get_cog('Discord Outbox')
+        statements = []
+        saving_event = self.saving_feed_messages.get(payload.message_id)
+
         try:
-            # Check if the message is from source forum channel and trigger role is mentioned
-            if (
-                    str(self.config['forum_feed_message_settings']['trigger_role_id']) in payload.data['mention_roles']
-                    and self.client.get_channel(payload.channel_id).parent.id == self.config['forum_feed_message_settings']['source_forum_channel_id']
-            ):
-                # Get the target channel, forum message, and feed message content
+            # Wait until the feed message that is being sent is saved before the removed trigger role deletes it
+            if saving_event is not None and self.trigger_role_mention not in payload.data['mention_roles']:
+                await saving_event.wait()
+
+            # Check if the trigger role is mentioned
+            if self.trigger_role_mention in payload.data['mention_roles']:
+                # Get the target channel, feed message content, and the forum feed embed built from the edit payload
                 feed_message_content = f"{self.client.config['forum_feed_message_settings']['feed_message']}"
                 target_channel = self.client.get_channel(self.config['forum_feed_message_settings']['target_channel_id'])
-                forum_message = await self.client.get_channel(payload.channel_id).fetch_message(payload.message_id)
+                embed, thread_name = await self._build_feed_embed(payload)
+
+                # Merge the edit into the feed message that is still waiting in the outbox, otherwise wait until the
+                # feed message that is being sent is saved so it is edited instead of sent twice
+                if saving_event is not None:
+                    if await outbox.edit(target_channel, None, key=payload.message_id, embed=embed):
+                        self.logger.info(f"Edited message with pending feed message | Message ID: {payload.message_id} | Edit merged")
+                        return
+                    await saving_event.wait()
 
                 # Check if the forum feed message and forum message is in the database based on message_id
-                result = cursor.execute(
-                    "SELECT forum_feed_message_id FROM forum_message WHERE message_id = ?",
-                    (payload.message_id,)
-                ).fetchone()
+                result = await forum_message_cache.fetchone(payload.message_id)
                 forum_feed_message_id = result[0] if result else None
 
                 # Check if the edited message is more than 3 days old and the forum feed message is in the database
@@ -114,137 +223,103 @@ class ForumFeedMessage(commands.Cog, name='Forum Feed Message'):
                         (datetime.now().timestamp() - datetime.fromisoformat(payload.data['edited_timestamp']).timestamp()) > timedelta(days=3).total_seconds()
                         and forum_feed_message_id is not None
                 ):
-                    # Get the old forum feed message
-                    old_feed_message = await target_channel.fetch_message(forum_feed_message_id)
-
-                    # Setups the embed message for new forum feed message
-                    embed = discord.Embed(title=f"{forum_message.jump_url}", description=f"{forum_message.content}", color=discord.Color.yellow())
-                    if payload.data['attachments']:
-                        embed.set_image(url=forum_message.attachments[0].url)
-                    embed.set_author(name=forum_message.author.name, icon_url=forum_message.author.avatar)
-                    embed.set_footer(text=str(forum_message.id))
-
                     # Delete the old forum feed message
-                    await old_feed_message.delete()
+                    await outbox.delete(target_channel, forum_feed_message_id, priority=PRIORITY_LOW)
 
                     # Send the new forum feed message to target channel
-                    new_feed_message = await target_channel.send(
-                        feed_message_content.format(mention=self.config['forum_feed_message_settings']['mention_role_id'], message=target_channel.channel.name),
+                    new_feed_message = await outbox.send(
+                        target_channel,
+                        content=feed_message_content.format(mention=self.config['forum_feed_message_settings']['mention_role_id'], message=thread_name),
                         embed=embed
                     )
 
                     # Update the forum message and forum feed message in the database
-                    cursor.execute(
+                    statements.append((
                         """
                         UPDATE forum_message SET edited_at = ?, forum_feed_message_id = ? WHERE message_id = ?
                         """,
                         (
                             payload.data['edited_timestamp'], new_feed_message.id, payload.message_id
                         )
-                    )
-                    cursor.execute(
+                    ))
+                    statements.append((
                         """
                         UPDATE forum_feed_message SET forum_feed_message_id = ?, created_at = ?, edited_at = ? WHERE forum_feed_message_id = ?
                         """,
                         (
                             new_feed_message.id, new_feed_message.created_at, new_feed_message.edited_at,
-                            old_feed_message.id
+                            forum_feed_message_id
                         )
-                    )
+                    ))
 
                     # Commit the all changes to the database
-                    async with self.client.get_cog('Database').db_lock:
-                        database.commit()
+                    await gateway.transaction(statements)
+                    forum_message_cache.put(payload.message_id, new_feed_message.id)
 
                     # Log the updated forum feed message
-                    self.logger.info(f"Edited message > 3 days | Message ID: {forum_message.id} | Forum feed message updated")
+                    self.logger.info(f"Edited message > 3 days | Message ID: {payload.message_id} | Forum feed message updated")
 
                 # Check if the edited message is less than 3 days old and the forum feed message is in the database
                 elif (
                         (datetime.now().timestamp() - datetime.fromisoformat(payload.data['edited_timestamp']).timestamp()) < timedelta(days=3).total_seconds()
                         and forum_feed_message_id is not None
                 ):
-                    # Get the old forum feed message
-                    old_feed_message = await target_channel.fetch_message(forum_feed_message_id)
-
-                    # Setups the embed message for new forum feed message
-                    embed = discord.Embed(title=f"{forum_message.jump_url}", description=f"{forum_message.content}", color=discord.Color.yellow())
-                    if payload.data['attachments']:
-                        embed.set_image(url=forum_message.attachments[0].url)
-                    embed.set_author(name=forum_message.author.name, icon_url=forum_message.author.avatar)
-                    embed.set_footer(text=str(forum_message.id))
-
                     # edit the old forum feed message
-                    new_feed_message = await old_feed_message.edit(embed=embed)
+                    new_feed_message = await outbox.edit(target_channel, forum_feed_message_id, embed=embed)
 
                     # Update the forum message and forum feed message in the database
-                    cursor.execute(
+                    statements.append((
                         """
                         UPDATE forum_message SET edited_at = ? WHERE message_id = ?
                         """,
                         (
                             payload.data['edited_timestamp'], payload.message_id
                         )
-                    )
-                    cursor.execute(
+                    ))
+                    statements.append((
                         """
                         UPDATE forum_feed_message SET edited_at = ? WHERE forum_feed_message_id = ?
                         """,
                         (
                             new_feed_message.edited_at, new_feed_message.id
                         )
-                    )
+                    ))
 
                     # Commit the all changes to the database
-                    async with self.client.get_cog('Database').db_lock:
-                        database.commit()
+                    await gateway.transaction(statements)
 
                     # Log the updated forum feed message
-                    self.logger.info(f"Edited message < 3 days | Message ID: {forum_message.id} | Forum feed message updated")
+                    self.logger.info(f"Edited message < 3 days | Message ID: {payload.message_id} | Forum feed message updated")
 
                 # Check if the forum feed message is not in the database
                 elif forum_feed_message_id is None:
-                    # Setups the embed message for new forum feed message
-                    embed = discord.Embed(title=f"{forum_message.jump_url}", description=f"{forum_message.content}", color=discord.Color.yellow())
-                    if payload.data['attachments']:
-                        embed.set_image(url=forum_message.attachments[0].url)
-                    embed.set_author(name=forum_message.author.name, icon_url=forum_message.author.avatar)
-                    embed.set_footer(text=f'{forum_message.id}')
-
                     # Send the new forum feed message to target channel
-                    new_feed_message = await target_channel.send(
-                        feed_message_content.format(mention=self.config['forum_feed_message_settings']['mention_role_id'], message=forum_message.channel.name),
+                    new_feed_message = await outbox.send(
+                        target_channel,
+                        content=feed_message_content.format(mention=self.config['forum_feed_message_settings']['mention_role_id'], message=thread_name),
                         embed=embed
                     )
 
-                    # Check and save if the forum message is in the database
-                    if cursor.execute("SELECT 1 FROM forum_message WHERE message_id = ?", (payload.message_id,)).fetchone() is not None:
-                        cursor.execute(
-                            """
-                            UPDATE forum_message SET edited_at = ?, forum_feed_message_id = ? WHERE message_id = ?
-                            """,
-                            (
-                                payload.data['edited_timestamp'], new_feed_message.id, payload.message_id
-                            )
-                        )
-                    else:
-                        cursor.execute(
-                            """
-                            INSERT INTO forum_message (
-                                message_id, thread_location_id, author_id, author_name, created_at, edited_at,
-                                forum_feed_message_id
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                payload.message_id, payload.channel_id, payload.data['author']['id'],
-                                payload.data['author']['username'], payload.data['timestamp'],
-                                payload.data['edited_timestamp'],
-                                new_feed_message.id
-                            )
+                    # Save the forum message to database or update it if the forum message is already in the database
+                    statements.append((
+                        """
+                        INSERT INTO forum_message (
+                            message_id, thread_location_id, author_id, author_name, created_at, edited_at,
+                            forum_feed_message_id
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (message_id) DO UPDATE SET
+                            edited_at = excluded.edited_at, forum_feed_message_id = excluded.forum_feed_message_id
+                        """,
+                        (
+                            payload.message_id, payload.channel_id, payload.data['author']['id'],
+                            payload.data['author']['username'], payload.data['timestamp'],
+                            payload.data['edited_timestamp'],
+                            new_feed_message.id
                         )
+                    ))
 
                     # Save the forum feed message to database
-                    cursor.execute(
+                    statements.append((
                         """
                         INSERT INTO forum_feed_message (
                             forum_feed_message_id, channel_id, created_at, edited_at
@@ -254,64 +329,54 @@ class ForumFeedMessage(commands.Cog, name='Forum Feed Message'):
                             new_feed_message.id, new_feed_message.channel.id,
                             new_feed_message.created_at, new_feed_message.edited_at
                         )
-                    )
+                    ))
 
                     # Commit the all changes to the database
-                    async with self.client.get_cog('Database').db_lock:
-                        database.commit()
+                    await gateway.transaction(statements)
+                    forum_message_cache.put(payload.message_id, new_feed_message.id)
 
                     # Log the updated forum feed message
                     self.logger.info(f"Edited message with added trigger role | Message ID: {payload.message_id} | Forum feed message updated")
-            elif (
-                    str(self.config['forum_feed_message_settings']['trigger_role_id']) not in payload.data['mention_roles']
-                    and self.client.get_channel(payload.channel_id).parent.id == self.config['forum_feed_message_settings']['source_forum_channel_id']
-                    and cursor.execute("SELECT 1 FROM forum_message WHERE message_id = ?", (payload.message_id,)).fetchone() is not None
-            ):
+            elif await forum_message_cache.fetchone(payload.message_id) is not None:
                 # Get the target channel
                 target_channel = self.client.get_channel(self.config['forum_feed_message_settings']['target_channel_id'])
 
                 # Check if the forum feed message and forum message is in the database based on message_id
-                result = cursor.execute(
-                    "SELECT forum_feed_message_id FROM forum_message WHERE message_id = ?",
-                    (payload.message_id,)
-                ).fetchone()
+                result = await forum_message_cache.fetchone(payload.message_id)
                 forum_feed_message_id = result[0] if result else None
 
                 # Check if the forum feed message is in the database
                 if forum_feed_message_id is not None:
-                    # Get the old forum feed message
-                    old_feed_message = await target_channel.fetch_message(forum_feed_message_id)
-
                     # Delete the old forum feed message
-                    await old_feed_message.delete()
+                    await outbox.delete(target_channel, forum_feed_message_id, priority=PRIORITY_LOW)
 
                     # Delete the forum message and forum feed message from database
-                    cursor.execute(
+                    statements.append((
                         "DELETE FROM forum_message WHERE message_id = ?",
                         (payload.message_id,)
-                    )
-                    cursor.execute(
+                    ))
+                    statements.append((
                         "DELETE FROM forum_feed_message WHERE forum_feed_message_id = ?",
-                        (old_feed_message.id,)
-                    )
+                        (forum_feed_message_id,)
+                    ))
 
                     # Commit the all changes to the database
-                    async with self.client.get_cog('Database').db_lock:
-                        database.commit()
+                    await gateway.transaction(statements)
+                    forum_message_cache.discard(payload.message_id)
 
                     # Log the updated forum feed message
                     self.logger.info(f"Edited message removed trigger role | Message ID: {payload.message_id} | Forum feed message deleted")
                 # Check if the forum feed message is not in the database
                 elif forum_feed_message_id is None:
                     # Delete the forum message from database
-                    cursor.execute(
+                    statements.append((
                         "DELETE FROM forum_message WHERE message_id = ?",
                         (payload.message_id,)
-                    )
+                    ))
 
                     # Commit the all changes to the database
-                    async with self.client.get_cog('Database').db_lock:
-                        database.commit()
+                    await gateway.transaction(statements)
+                    forum_message_cache.discard(payload.message_id)
 
                     # Log the updated forum feed message
                     self.logger.info(f"Edited message removed trigger role | Message ID: {payload.message_id} | Forum message data deleted")
@@ -319,57 +384,60 @@ class ForumFeedMessage(commands.Cog, name='Forum Feed Message'):
             self.logger.error(f"Edited message detected | Message ID: {payload.message_id} | Forum feed message not updated | {e}")
 
     """
-    Delete feed message on target channel when message at source forum channel get deleted
+    Delete feed message on target channel when message at source forum channel get deleted, the deleted messages are
+    routed by the event router and the untracked messages stop at the cache lookup
     """
     @commands.Cog.listener()
-    async def on_raw_message_delete(self, payload) -> None:
+    async def on_forum_feed_message_delete(self, payload) -> None:
         await self.client.get_cog('Database').db_initialization_event.wait()
 
+        gateway = self.client.get_cog('Database').gateway
+        forum_message_cache = self.client.get_cog('Database').forum_message_cache
+        outbox = self.client.get_cog('Discord Outbox')
+        statements = []
+
         try:
             # Check if the forum feed message is in the database based on message_id
-            result = cursor.execute(
-                "SELECT forum_feed_message_id FROM forum_message WHERE message_id = ?",
-                (payload.message_id,)
-            ).fetchone()
-            forum_feed_message_id = result[0] if result else None
+            result = await forum_message_cache.fetchone(payload.message_id)
+            if result is None:
+                return
+
+            forum_feed_message_id = result[0]
 
             # Check if the forum feed message is in the database
             if forum_feed_message_id is not None:
                 # Get the target channel
                 target_channel = self.client.get_channel(self.config['forum_feed_message_settings']['target_channel_id'])
 
-                # Get the old forum feed message
-                old_feed_message = await target_channel.fetch_message(forum_feed_message_id)
-
                 # Delete the old forum feed message
-                await old_feed_message.delete()
+                await outbox.delete(target_channel, forum_feed_message_id, priority=PRIORITY_LOW)
 
                 # Delete the forum message and forum feed message from database
-                cursor.execute(
+                statements.append((
                     "DELETE FROM forum_message WHERE message_id = ?",
                     (payload.message_id,)
-                )
-                cursor.execute(
+                ))
+                statements.append((
                     "DELETE FROM forum_feed_message WHERE forum_feed_message_id = ?",
-                    (old_feed_message.id,)
-                )
+                    (forum_feed_message_id,)
+                ))
 
                 # Commit the all changes to the database
-                async with self.client.get_cog('Database').db_lock:
-                    database.commit()
+                await gateway.transaction(statements)
+                forum_message_cache.discard(payload.message_id)
 
                 # Log the deleted forum feed message
                 self.logger.info(f"Deleted message | Message ID: {payload.message_id} | Forum feed message deleted")
             if forum_feed_message_id is None:
                 # Delete the forum message from database
-                cursor.execute(
+                statements.append((
                     "DELETE FROM forum_message WHERE message_id = ?",
                     (payload.message_id,)
-                )
+                ))
 
                 # Commit the all changes to the database
-                async with self.client.get_cog('Database').db_lock:
-                    database.commit()
+                await gateway.transaction(statements)
+                forum_message_cache.discard(payload.message_id)
 
                 # Log the deleted forum feed message
                 self.logger.info(f"Deleted message | Message ID: {payload.message_id} | Forum message data deleted")
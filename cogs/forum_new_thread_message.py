@@ -1,11 +1,7 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
+from collections import Counter
 import asyncio
-import sqlite3
-
-
-database = sqlite3.connect('data/data.db')
-cursor = database.cursor()
 
 
 class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
@@ -13,6 +9,25 @@ class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
         self.client = client
         self.config = self.client.config
         self.logger = self.client.logger
+        self.starter_message_timeout = self.config['forum_new_thread_message_settings']['starter_message_timeout']
+        self.starter_message_waiters = {}
+        self.starter_message_counters = Counter()
+        self.log_starter_message_counters.start()
+
+    """
+    Stop the starter message counters log when the cog is unloaded
+    """
+    async def cog_unload(self) -> None:
+        self.log_starter_message_counters.cancel()
+
+    """
+    Subscribe the source forum channel edits to the event router
+    """
+    @commands.Cog.listener()
+    async def on_ready(self) -> None:
+        self.client.get_cog('Event Router').subscribe(
+            'forum_thread_starter_edit', parent_ids=(self.config['forum_new_thread_message_settings']['source_forum_channel_id'],)
+        )
 
     """
     Send new thread message on target channel when there is new thread created at source forum channel
@@ -21,25 +36,24 @@ class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
     async def on_thread_create(self, thread) -> None:
         await self.client.get_cog('Database').db_initialization_event.wait()
 
-        cursor.execute(
-            "SELECT forum_new_thread_message_id FROM forum_thread WHERE thread_id = ?",
-            (thread.id,)
-        )
-        forum_new_thread_message_id = cursor.fetchone()
+        gateway = self.client.get_cog('Database').gateway
+        forum_thread_cache = self.client.get_cog('Database').forum_thread_cache
+        outbox = self.client.get_cog('Discord Outbox')
+        statements = []
+
+        forum_new_thread_message_id = await forum_thread_cache.fetchone(thread.id)
         try:
             # Check if the new thread is created at the source forum channel
             if thread.parent_id == self.config['forum_new_thread_message_settings']['source_forum_channel_id'] and forum_new_thread_message_id is None:
                 # Get the target channel and new thread message format
                 target_channel = self.client.get_channel(self.config['forum_new_thread_message_settings']['target_channel_id'])
                 feed_message_new = f"{self.client.config['forum_new_thread_message_settings']['new_thread_message']}"
-                starter_message = None
 
-                # Wait until the thread starter message is fetched
-                while starter_message is None:
-                    try:
-                        starter_message = await thread.fetch_message(thread.id)
-                    except discord.NotFound:
-                        await asyncio.sleep(1)
+                # Wait until the thread starter message is resolved
+                starter_message = await self._resolve_starter_message(thread)
+                if starter_message is None:
+                    self.logger.warning(f"New thread detected | Thread ID: {thread.id} | Starter message not found, new thread message not sent")
+                    return
 
                 # Setups the embed message for new thread message
                 embed = discord.Embed(title=f"{thread.jump_url}", description=f"{starter_message.content}", color=discord.Color.green())
@@ -49,57 +63,100 @@ class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
                 embed.set_footer(text=str(thread.id))
 
                 # Send the new thread message to the target channel
-                new_thread_message = await target_channel.send(
-                    feed_message_new.format(mention=self.client.config['forum_new_thread_message_settings']['mention_role_id'], thread=thread.name),
+                new_thread_message = await outbox.send(
+                    target_channel,
+                    content=feed_message_new.format(mention=self.client.config['forum_new_thread_message_settings']['mention_role_id'], thread=thread.name),
                     embed=embed
                 )
 
-                # Insert the new thread and new thread message into the database
-                cursor.execute(
-                    "SELECT 1 FROM forum_thread WHERE thread_id = ?",
-                    (thread.id,)
-                )
-                if not cursor.fetchone():
-                    cursor.execute(
-                        """
-                        INSERT INTO forum_thread (
-                            thread_id, thread_name, thread_location_id, thread_location, author_id, author_name,
-                            created_at, jump_url, member_count, message_count, locked, archived, 
-                            forum_new_thread_message_id
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            thread.id, thread.name, thread.parent_id, thread.parent.name, thread.owner_id,
-                            thread.owner.name, thread.created_at, thread.jump_url, thread.member_count,
-                            thread.message_count, thread.locked, thread.archived, new_thread_message.id
-                        )
+                # Insert the new thread and new thread message into the database, a thread already saved by the
+                # database sync only gets linked to the new thread message
+                statements.append((
+                    """
+                    INSERT INTO forum_thread (
+                        thread_id, thread_name, thread_location_id, thread_location, author_id, author_name,
+                        created_at, jump_url, member_count, message_count, locked, archived, 
+                        forum_new_thread_message_id
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (thread_id) DO UPDATE SET forum_new_thread_message_id = excluded.forum_new_thread_message_id
+                    """,
+                    (
+                        thread.id, thread.name, thread.parent_id, thread.parent.name, thread.owner_id,
+                        thread.owner.name, thread.created_at, thread.jump_url, thread.member_count,
+                        thread.message_count, thread.locked, thread.archived, new_thread_message.id
                     )
-                cursor.execute(
-                    "SELECT 1 FROM forum_new_thread_message WHERE forum_new_thread_message_id = ?",
-                    (new_thread_message.id,)
-                )
-                if not cursor.fetchone():
-                    cursor.execute(
-                        """
-                        INSERT INTO forum_new_thread_message (
-                            forum_new_thread_message_id, channel_id, created_at, edited_at
-                        ) VALUES (?, ?, ?, ?)
-                        """,
-                        (
-                            new_thread_message.id, new_thread_message.channel.id, new_thread_message.created_at,
-                            new_thread_message.edited_at
-                        )
+                ))
+                statements.append((
+                    """
+                    INSERT INTO forum_new_thread_message (
+                        forum_new_thread_message_id, channel_id, created_at, edited_at
+                    ) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (forum_new_thread_message_id) DO NOTHING
+                    """,
+                    (
+                        new_thread_message.id, new_thread_message.channel.id, new_thread_message.created_at,
+                        new_thread_message.edited_at
                     )
+                ))
 
                 # Commit the all changes to the database
-                async with self.client.get_cog('Database').db_lock:
-                    database.commit()
+                await gateway.transaction(statements)
+                forum_thread_cache.put(thread.id, new_thread_message.id)
 
                 # Log the new thread message
                 self.logger.info(f"New thread detected | Thread ID: {thread.id} | New thread message sent")
         except Exception as e:
             self.logger.error(f"Failed to send new thread message | {e}")
 
+    """
+    Resolve the waiting thread starter message when it arrives from the gateway
+    """
+    @commands.Cog.listener()
+    async def on_message(self, message) -> None:
+        # The thread starter message id is the same as the thread id
+        waiter = self.starter_message_waiters.get(message.id)
+        if waiter is not None and message.id == message.channel.id and not waiter.done():
+            waiter.set_result(message)
+
+    """
+    Helper method for resolve the thread starter message from the message cache or the gateway on_message event,
+    the message is fetched with exponential backoff only while it has not arrived yet, up to the starter message timeout
+    """
+    async def _resolve_starter_message(self, thread):
+        if thread.starter_message is not None:
+            self.starter_message_counters['cache'] += 1
+            return thread.starter_message
+
+        loop = asyncio.get_running_loop()
+        waiter = self.starter_message_waiters.setdefault(thread.id, loop.create_future())
+        deadline = loop.time() + self.starter_message_timeout
+        delay = 1
+
+        try:
+            while True:
+                # Wait for the starter message from the gateway before fetching it
+                try:
+                    message = await asyncio.wait_for(asyncio.shield(waiter), timeout=min(delay, max(deadline - loop.time(), 0)))
+                    self.starter_message_counters['gateway'] += 1
+                    return message
+                except asyncio.TimeoutError:
+                    pass
+
+                try:
+                    message = await thread.fetch_message(thread.id)
+                    self.starter_message_counters['fetch'] += 1
+                    return message
+                except discord.NotFound:
+                    self.starter_message_counters['fetch_retry'] += 1
+
+                if loop.time() >= deadline:
+                    self.starter_message_counters['timeout'] += 1
+                    return None
+
+                delay *= 2
+        finally:
+            self.starter_message_waiters.pop(thread.id, None)
+
     """
     Update new thread message on target channel when thread at source forum channel get edited
     """
@@ -107,19 +164,19 @@ class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
     async def on_raw_thread_update(self, payload) -> None:
         await self.client.get_cog('Database').db_initialization_event.wait()
 
-        cursor.execute(
-            "SELECT forum_new_thread_message_id FROM forum_thread WHERE thread_id = ?",
-            (payload.thread_id,)
-        )
-        forum_new_thread_message_id = cursor.fetchone()
+        gateway = self.client.get_cog('Database').gateway
+        forum_thread_cache = self.client.get_cog('Database').forum_thread_cache
+        outbox = self.client.get_cog('Discord Outbox')
+        statements = []
+
+        forum_new_thread_message_id = await forum_thread_cache.fetchone(payload.thread_id)
 
         # Check if the thread id is existed in forum_thread table
         if forum_new_thread_message_id:
             try:
-                # Get the target channel, updated thread, new thread message, and new thread message content
+                # Get the target channel, updated thread, and new thread message content
                 target_channel = self.client.get_channel(self.config['forum_new_thread_message_settings']['target_channel_id'])
                 thread_post_updated = self.client.get_channel(payload.thread_id)
-                new_thread_message = await target_channel.fetch_message(forum_new_thread_message_id[0])
                 new_thread_message_content = f"{self.client.config['forum_new_thread_message_settings']['new_thread_message']}"
                 starter_message = await thread_post_updated.fetch_message(payload.thread_id)
 
@@ -131,32 +188,33 @@ class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
                 embed.set_footer(text=str(payload.thread_id))
 
                 # Edit the new thread message on the target channel
-                await new_thread_message.edit(
+                new_thread_message = await outbox.edit(
+                    target_channel,
+                    forum_new_thread_message_id[0],
                     content=new_thread_message_content.format(mention=self.client.config['forum_new_thread_message_settings']['mention_role_id'], thread=payload.thread.name),
                     embed=embed
                 )
 
                 # Update the updated thread content and new thread message into the database
-                cursor.execute(
+                statements.append((
                     """
                     UPDATE forum_thread SET thread_name = ? WHERE thread_id = ?
                     """,
                     (
                         payload.thread.name, payload.thread_id
                     )
-                )
-                cursor.execute(
+                ))
+                statements.append((
                     """
                     UPDATE forum_new_thread_message SET edited_at = ? WHERE forum_new_thread_message_id = ?
                     """,
                     (
                         new_thread_message.edited_at, forum_new_thread_message_id[0]
                     )
-                )
+                ))
 
                 # Commit the all changes to the database
-                async with self.client.get_cog('Database').db_lock:
-                    database.commit()
+                await gateway.transaction(statements)
 
                 # Log the edited thread message
                 self.logger.info(f"Thread updated | Thread ID: {payload.thread_id} | New thread message updated")
@@ -167,22 +225,26 @@ class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
     Update new thread message on target channel when thread starter message at source forum channel get edited
     """
     @commands.Cog.listener()
-    async def on_raw_message_edit(self, payload) -> None:
+    async def on_forum_thread_starter_edit(self, payload) -> None:
+        # Ignore the edit if it is not the thread starter message, the starter message id is the same as the thread id
+        if payload.message_id != payload.channel_id:
+            return
+
         await self.client.get_cog('Database').db_initialization_event.wait()
 
-        cursor.execute(
-            "SELECT forum_new_thread_message_id FROM forum_thread WHERE thread_id = ?",
-            (payload.message_id,)
-        )
-        new_thread_message_id = cursor.fetchone()
+        gateway = self.client.get_cog('Database').gateway
+        forum_thread_cache = self.client.get_cog('Database').forum_thread_cache
+        outbox = self.client.get_cog('Discord Outbox')
+        statements = []
+
+        new_thread_message_id = await forum_thread_cache.fetchone(payload.message_id)
 
         # Check if the new thread message id is existed in forum_thread table
         if new_thread_message_id:
             try:
-                # Get the target channel, thread starter channel, new thread message, and new thread message content
+                # Get the target channel, thread starter channel, and new thread message content
                 target_channel = self.client.get_channel(self.config['forum_new_thread_message_settings']['target_channel_id'])
                 thread_post_starter = self.client.get_channel(payload.message_id)
-                new_thread_message = await target_channel.fetch_message(new_thread_message_id[0])
                 new_thread_message_content = f"{self.client.config['forum_new_thread_message_settings']['new_thread_message']}"
                 starter_message = await thread_post_starter.fetch_message(payload.message_id)
 
@@ -194,24 +256,25 @@ class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
                 embed.set_footer(text=f'{payload.message_id}')
 
                 # Edit the new thread message on the target channel
-                await new_thread_message.edit(
+                new_thread_message = await outbox.edit(
+                    target_channel,
+                    new_thread_message_id[0],
                     content=new_thread_message_content.format(mention=self.client.config['forum_new_thread_message_settings']['mention_role_id'], thread=thread_post_starter.name),
                     embed=embed
                 )
 
                 # Update the updated thread starter message content into the database
-                cursor.execute(
+                statements.append((
                     """
                     UPDATE forum_new_thread_message SET edited_at = ? WHERE forum_new_thread_message_id = ?
                     """,
                     (
                         new_thread_message.edited_at, new_thread_message_id[0]
                     )
-                )
+                ))
 
                 # Commit the all changes to the database
-                async with self.client.get_cog('Database').db_lock:
-                    database.commit()
+                await gateway.transaction(statements)
 
                 # Log the edited thread starter message
                 self.logger.info(f"Thread starter message updated | Thread ID: {payload.message_id} | New thread message updated")
@@ -225,39 +288,34 @@ class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
     async def on_raw_thread_delete(self, payload) -> None:
         await self.client.get_cog('Database').db_initialization_event.wait()
 
-        cursor.execute(
-            "SELECT 1 FROM forum_thread WHERE thread_id = ?",
-            (payload.thread_id,)
-        )
+        gateway = self.client.get_cog('Database').gateway
+        forum_thread_cache = self.client.get_cog('Database').forum_thread_cache
+        outbox = self.client.get_cog('Discord Outbox')
+        statements = []
 
         # Check if the thread id is existed in forum_thread table
-        if cursor.fetchone():
+        if await forum_thread_cache.fetchone(payload.thread_id):
             try:
-                # Get the target channel, new thread message id, and new thread message
+                # Get the target channel and new thread message id
                 target_channel = self.client.get_channel(self.config['forum_new_thread_message_settings']['target_channel_id'])
-                cursor.execute(
-                    "SELECT forum_new_thread_message_id FROM forum_thread WHERE thread_id = ?",
-                    (payload.thread_id,)
-                )
-                forum_new_thread_message_id = cursor.fetchone()
-                new_thread_message = await target_channel.fetch_message(forum_new_thread_message_id[0])
+                forum_new_thread_message_id = await forum_thread_cache.fetchone(payload.thread_id)
 
                 # Delete the new thread message on the target channel
-                await new_thread_message.delete()
+                await outbox.delete(target_channel, forum_new_thread_message_id[0])
 
                 # Delete the thread and new thread message from the database
-                cursor.execute(
+                statements.append((
                     "DELETE FROM forum_thread WHERE thread_id = ?",
                     (payload.thread_id,)
-                )
-                cursor.execute(
+                ))
+                statements.append((
                     "DELETE FROM forum_new_thread_message WHERE forum_new_thread_message_id = ?",
                     (forum_new_thread_message_id[0],)
-                )
+                ))
 
                 # Commit the all changes to the database
-                async with self.client.get_cog('Database').db_lock:
-                    database.commit()
+                await gateway.transaction(statements)
+                forum_thread_cache.discard(payload.thread_id)
 
                 # Log the deleted thread message
                 self.logger.info(f"Thread deleted | Thread ID: {payload.thread_id} | New thread message deleted")
@@ -265,5 +323,24 @@ class ForumNewThreadMessage(commands.Cog, name='Forum New Thread Message'):
                 self.logger.error(f"Failed to delete new thread message | {e}")
 
 
+    """
+    Log how the thread starter messages were resolved every 15 minutes
+    """
+    @tasks.loop(minutes=15)
+    async def log_starter_message_counters(self) -> None:
+        if self.starter_message_counters:
+            self.logger.info(
+                "Starter message counters | "
+                + ", ".join(f"{name}: {count}" for name, count in sorted(self.starter_message_counters.items()))
+            )
+
+    """
+    Make sure the log_starter_message_counters task waits until the client is ready before starting
+    """
+    @log_starter_message_counters.before_loop
+    async def before_log_starter_message_counters(self) -> None:
+        await self.client.wait_until_ready()
+
+
 async def setup(client) -> None:
     await client.add_cog(ForumNewThreadMessage(client))
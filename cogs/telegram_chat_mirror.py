@@ -1,16 +1,207 @@
 import asyncio
+import hashlib
 import json
 import os
+import re
+import tempfile
+import unicodedata
+from collections import OrderedDict
 from datetime import timedelta
-from telethon import TelegramClient, events
-from telethon.tl.types import InputPeerChannel
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+from telethon import TelegramClient, events, utils
+from telethon.tl.types import PeerChannel, PeerChat
 import discord
 from discord.ext import commands
-import sqlite3
+from cogs.discord_outbox import PRIORITY_LOW
+
+
+# Discord message length limit and the fence used to close and reopen a code block that is split into parts
+DISCORD_MESSAGE_LIMIT = 2000
+CODE_FENCE = "```"
+
+# Markdown code blocks, and the inline code, links and urls that should not be cut in the middle, the inline entities
+# are only searched around the end of the part
+CODE_BLOCK_PATTERN = re.compile(r"```(?P<language>[^\n`]*)\n.*?(?:```|\Z)", re.DOTALL)
+INLINE_ENTITY_PATTERN = re.compile(r"`[^`\n]+`|\[[^\]\n]*\]\([^)\s]*\)|https?://\S+")
+INLINE_ENTITY_WINDOW = 512
+
+# Only a short single token after the opening fence is a language that is repeated when the code block is reopened,
+# any other first line is code and the code block is reopened with a plain fence
+LANGUAGE_PATTERN = re.compile(r"[\w+#.-]{1,32}")
+
+# The smallest room of a part that always fits the reopened fence, the closing fence and some text, and the most
+# joined characters the cut backs off over before it cuts at the end of the part
+MIN_PART_LENGTH = 64
+MAX_JOINED_BACKOFF = 32
+
+
+# Check if the character must stay with the character before it, like combining marks, variation selectors and
+# zero width joiners of emoji sequences
+def is_joined_character(character) -> bool:
+    return unicodedata.combining(character) != 0 or character == "\u200d" or "\ufe00" <= character <= "\ufe0f"
+
+
+# Split the text into parts that fit the discord message limit in a single pass over the text, the first part also
+# has room for the header. The parts are cut at a line break or space in the last half of the part, never inside a
+# link, url or inline code that fits in a part and never between joined characters, and a code block that has to be
+# cut is closed at the end of the part and reopened at the start of the next part
+def split_message(text, limit=DISCORD_MESSAGE_LIMIT, header_length=0):
+    if limit - header_length < MIN_PART_LENGTH:
+        raise ValueError(f"limit must leave at least {MIN_PART_LENGTH} characters after the header")
+
+    code_blocks = [
+        (match.start(), match.end(), match.group('language') if LANGUAGE_PATTERN.fullmatch(match.group('language')) else "")
+        for match in CODE_BLOCK_PATTERN.finditer(text)
+    ]
+    parts = []
+    cursor = 0
+    code_block_index = 0
+    reopen_fence = ""
+
+    while True:
+        budget = (limit - header_length if not parts else limit) - len(reopen_fence)
+        assert budget > len(reopen_fence) + len(CODE_FENCE) + 1
+        if len(text) - cursor <= budget:
+            parts.append(reopen_fence + text[cursor:])
+            return parts
+
+        # Find the code block or the inline entity that the end of the part falls into
+        end = cursor + budget
+        while code_block_index < len(code_blocks) and code_blocks[code_block_index][1] <= end:
+            code_block_index += 1
+
+        entity = None
+        if code_block_index < len(code_blocks) and code_blocks[code_block_index][0] < end:
+            entity = code_blocks[code_block_index]
+        else:
+            for match in INLINE_ENTITY_PATTERN.finditer(text, max(cursor, end - INLINE_ENTITY_WINDOW), end + INLINE_ENTITY_WINDOW):
+                if match.start() >= end:
+                    break
+                if match.end() > end:
+                    entity = (match.start(), match.end(), None)
+                    break
+
+        in_code_block = entity is not None and entity[2] is not None
+        closing_fence = ""
+
+        if entity is not None and entity[0] > cursor and not (in_code_block and entity[0] - cursor < budget // 2):
+            # Move the whole entity to the next part
+            cut = entity[0]
+        else:
+            if in_code_block:
+                closing_fence = "\n" + CODE_FENCE
+                end -= len(closing_fence)
+
+            # Cut at the last line break or space in the last half of the part, or at the end of the part
+            cut = text.rfind("\n", cursor + budget // 2, end)
+            if cut == -1 and not in_code_block:
+                cut = text.rfind(" ", cursor + budget // 2, end)
+            if cut == -1:
+                cut = end
+                while cut > cursor + 1 and (is_joined_character(text[cut]) or text[cut - 1] == "\u200d"):
+                    cut -= 1
+                    if end - cut > MAX_JOINED_BACKOFF:
+                        cut = end
+                        break
+
+        assert cut > cursor
+        parts.append(reopen_fence + text[cursor:cut] + closing_fence)
+        reopen_fence = f"{CODE_FENCE}{entity[2]}\n" if closing_fence else ""
+
+        # Skip the whitespace between the parts, only the line break is skipped inside a code block
+        cursor = cut
+        if closing_fence:
+            if text.startswith("\n", cursor):
+                cursor += 1
+        else:
+            while cursor < len(text) and text[cursor].isspace():
+                cursor += 1
+            if cursor == len(text):
+                return parts
+
+
+# Hash the rendered content of the mirrored message part, so an edit only touches the parts that changed
+def content_hash(content) -> str:
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+# Create a new class called MirrorJob
+class MirrorJob:
+    def __init__(self, event, group_id, target_channel) -> None:
+        self.event = event
+        self.events = [event]
+        self.group_id = group_id
+        self.target_channel = target_channel
+        self.flush_at = None
+        self.media_files = []
+        self.media_links = []
+        self.parts = None
+        self.replied_message = None
+        self.discord_message_ids = []
+        self.failed = False
+        self.ready = asyncio.Event()
+
+
+# Create a new class called MirrorRoute
+class MirrorRoute(NamedTuple):
+    peer: object
+    chat_ids: tuple
+    topic_id: Optional[int]
+    target_channel: object
+
+
+# Create a new class called MirrorRoutingTable
+class MirrorRoutingTable:
+    def __init__(self, routes) -> None:
+        self.routes = tuple(routes)
+        self.route_by_key = MappingProxyType({
+            (chat_id, route.topic_id): route for route in self.routes for chat_id in route.chat_ids
+        })
+        self.chat_ids = frozenset(chat_id for chat_id, _ in self.route_by_key)
+        self.topic_chat_ids = frozenset(
+            chat_id for route in self.routes if route.topic_id is not None for chat_id in route.chat_ids
+        )
+
+    """
+    Get the route of the message in the chat, the route of the topic the message replies to comes before the route
+    of the whole group
+    """
+    def match(self, chat_id, reply_to) -> Optional[MirrorRoute]:
+        if reply_to is not None and chat_id in self.topic_chat_ids:
+            route = (
+                self.route_by_key.get((chat_id, reply_to.reply_to_top_id))
+                or self.route_by_key.get((chat_id, reply_to.reply_to_msg_id))
+            )
+            if route is not None:
+                return route
+
+        return self.route_by_key.get((chat_id, None))
+
+    """
+    Check if the message event belongs to a route, used as the predicate of the telegram handlers so the messages of
+    the unmirrored chats and topics never reach the handlers
+    """
+    def is_routed(self, event) -> bool:
+        if event.chat_id not in self.chat_ids:
+            return False
+        return self.match(event.chat_id, event.message.reply_to) is not None
+
 
+# Create a new class called MirrorTelegramClient
+class MirrorTelegramClient(TelegramClient):
+    def __init__(self, *args, on_reconnect=None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.on_reconnect = on_reconnect
 
-database = sqlite3.connect('data/data.db', timeout=5)
-cursor = database.cursor()
+    """
+    Run the reconnect callback after telethon reconnected by itself, telethon calls this method once the connection is
+    back and the catch up of its own updates is started
+    """
+    async def _handle_auto_reconnect(self):
+        await super()._handle_auto_reconnect()
+        if self.on_reconnect is not None:
+            await self.on_reconnect()
 
 
 class TelegramToDiscord(commands.Cog):
@@ -19,135 +210,472 @@ class TelegramToDiscord(commands.Cog):
         self.logger = self.bot.logger
         self.session_dir = f"{os.path.dirname(os.path.realpath(os.path.dirname(__file__)))}"\
                            f"/data/{self.bot.config['telegram_chat_mirror_settings']['session_name']}"
-        self.telegram_client = TelegramClient(
+        self.telegram_client = MirrorTelegramClient(
             self.session_dir,
             os.getenv('API_ID'),
-            os.getenv('API_HASH')
+            os.getenv('API_HASH'),
+            on_reconnect=self.handle_reconnect
         )
-        self.telegram_group_ids = self.bot.config['telegram_chat_mirror_settings']['group_ids']
-        self.telegram_group_topics = []
-        self.target_channel_ids = self.bot.config['telegram_chat_mirror_settings']['target_channel_ids']
+        self.config_path = f"{os.path.dirname(os.path.realpath(os.path.dirname(__file__)))}/config.json"
+        self.config_mtime = None
+        self.routing_table = MirrorRoutingTable(())
+        self.pipeline_queue_size = self.bot.config['telegram_chat_mirror_settings']['pipeline_queue_size']
+        self.pipeline_workers = self.bot.config['telegram_chat_mirror_settings']['pipeline_workers']
+        self.download_queue = asyncio.Queue(maxsize=self.pipeline_queue_size)
+        self.render_queue = asyncio.Queue(maxsize=self.pipeline_queue_size)
+        self.persist_queue = asyncio.Queue(maxsize=self.pipeline_queue_size)
+        self.deliver_queues = {}
+        self.pipeline_tasks = []
+        self.max_media_size = self.bot.config['telegram_chat_mirror_settings']['max_media_size']
+        self.media_spool_size = self.bot.config['telegram_chat_mirror_settings']['media_spool_size']
+        self.album_flush_window = self.bot.config['telegram_chat_mirror_settings']['album_flush_window']
+        self.album_jobs = {}
+        self.catch_up_limit = self.bot.config['telegram_chat_mirror_settings']['catch_up_limit']
+        self.routing_config_check_interval = self.bot.config['telegram_chat_mirror_settings']['routing_config_check_interval']
+        self.ingested_message_ids = {}
+        self.unsaved_message_ids = {}
 
     """
-    Resolve group IDs to InputPeerChannel objects
+    Stop the pipeline workers when the cog is unloaded
     """
-    def resolve_group_ids(self):
-        for i, group in enumerate(self.telegram_group_ids):
-            if "_" in str(group):
-                group_id, access_hash = group.split("_")
+    async def cog_unload(self) -> None:
+        for task in self.pipeline_tasks:
+            task.cancel()
 
-                self.telegram_group_ids[i] = InputPeerChannel(
-                    channel_id=int(group_id),
-                    access_hash=int(access_hash)
-                )
+    """
+    Build the routing table of the configured groups and topics, the group written as <group id>_<topic id> only
+    mirrors the topic of the forum group, the config is not modified
+    """
+    def build_routing_table(self, settings) -> MirrorRoutingTable:
+        if len(settings['group_ids']) != len(settings['target_channel_ids']):
+            raise ValueError("group_ids and target_channel_ids must have the same length")
+
+        routes = []
+        for group, target_channel_id in zip(settings['group_ids'], settings['target_channel_ids']):
+            target_channel = self.bot.get_channel(target_channel_id)
+            if target_channel is None:
+                self.logger.error(f"Telegram mirror route skipped | Group: {group} | Channel ID: {target_channel_id} not found")
+                continue
 
-                self.telegram_group_topics.append(access_hash)
+            if "_" in str(group):
+                group_id, topic_id = (int(value) for value in group.split("_"))
+                # Let telethon resolve the access hash of the forum group from the session
+                peer = PeerChannel(group_id)
+                chat_ids = (utils.get_peer_id(PeerChannel(group_id)),)
             else:
-                self.telegram_group_topics.append(None)
+                # The unmarked group ID can be a basic group or a channel, the same as the chats filter of telethon
+                group_id, topic_id = int(group), None
+                peer = group_id
+                chat_ids = (
+                    (group_id,) if group_id < 0
+                    else (utils.get_peer_id(PeerChannel(group_id)), utils.get_peer_id(PeerChat(group_id)))
+                )
+
+            routes.append(MirrorRoute(peer, chat_ids, topic_id, target_channel))
+
+        return MirrorRoutingTable(routes)
+
+    """
+    Load the routing table from the settings, the table is swapped as a whole so the handlers never see a half built
+    table and pick up the new routes without being registered again
+    """
+    def load_routing_table(self, settings) -> None:
+        self.routing_table = self.build_routing_table(settings)
+
+        # Only route the deleted messages in the target channels to this cog
+        self.bot.get_cog('Event Router').subscribe(
+            'telegram_mirror_message_delete',
+            channel_ids=[route.target_channel.id for route in self.routing_table.routes]
+        )
+
+        self.logger.info(f"Telegram mirror routing table loaded | {len(self.routing_table.routes)} routes")
+
+    """
+    Reload the routing table when the telegram mirror settings in config.json changed, the old table is kept when the
+    new settings are invalid
+    """
+    def reload_routing_table(self) -> None:
+        config_mtime = os.path.getmtime(self.config_path)
+        if config_mtime == self.config_mtime:
+            return
+        self.config_mtime = config_mtime
+
+        try:
+            with open(self.config_path, 'r') as file:
+                settings = json.load(file)['telegram_chat_mirror_settings']
+
+            if (
+                settings['group_ids'] == self.bot.config['telegram_chat_mirror_settings']['group_ids']
+                and settings['target_channel_ids'] == self.bot.config['telegram_chat_mirror_settings']['target_channel_ids']
+            ):
+                return
+
+            self.load_routing_table(settings)
+            self.bot.config['telegram_chat_mirror_settings'].update(
+                group_ids=settings['group_ids'],
+                target_channel_ids=settings['target_channel_ids']
+            )
+        except Exception as e:
+            self.logger.error(f"Telegram mirror routing table not reloaded | {e}")
+
+    """
+    Register one handler per telegram event type for all the routes, the predicates look up the routing table that is
+    current when the event arrives
+    """
+    def register_telegram_handlers(self) -> None:
+        self.telegram_client.add_event_handler(
+            self.handle_new_message, events.NewMessage(func=lambda event: self.routing_table.is_routed(event))
+        )
+        self.telegram_client.add_event_handler(
+            self.handle_edited_message, events.MessageEdited(func=lambda event: self.routing_table.is_routed(event))
+        )
+        self.telegram_client.add_event_handler(
+            self.handle_deleted_message,
+            events.MessageDeleted(func=lambda event: event.chat_id in self.routing_table.chat_ids)
+        )
+
+    """
+    Static method to format the header of the first part of the mirrored message
+    """
+    @staticmethod
+    def format_header(author, date):
+        return "```{} | {}``` \n".format(author if author else "Unknown Author", date.strftime('%Y-%m-%d %H:%M:%S'))
 
     """
-    Static method to split the message into parts
+    Static method to format the link of the telegram media that is too large to upload to discord
     """
     @staticmethod
-    def split_message(text, limit=1900):
-        parts = []
-        while len(text) > limit:
-            index = text.rfind(" ", 0, limit)
-            if index == -1:
-                index = limit
-            parts.append(text[:index])
-            text = text[index:].strip()
-        parts.append(text)
-        return parts
+    def format_media_link(group_id, message):
+        return f"https://t.me/c/{utils.resolve_id(group_id)[0]}/{message.id}"
+
+    """
+    Add the links of the telegram media that are too large to upload to the last part, the links are sent as their own
+    part when the last part has no room left for them
+    """
+    def append_media_links(self, parts, media_links, author, date):
+        links = "\n".join(media_links)
+        last_part_length = len(parts[-1]) + (len(self.format_header(author, date)) if len(parts) == 1 else 0)
+        if last_part_length + len("\n") + len(links) <= DISCORD_MESSAGE_LIMIT:
+            parts[-1] = "\n".join([parts[-1], links])
+        else:
+            parts.append(links)
+
+    """
+    Render the content of every mirrored message part, the first part starts with the header
+    """
+    def render_contents(self, parts, author, date):
+        return [self.format_header(author, date) + parts[0], *parts[1:]]
 
     """
     Telegram client to interact with the telegram group and channel
     """
     async def start_telegram_client(self):
-        self.resolve_group_ids()
-
-        for group_id in self.telegram_group_ids:
-            self.telegram_client.add_event_handler(
-                lambda event, group_id=group_id: self.handle_new_message(event, group_id),
-                events.NewMessage(chats=group_id)
-            )
-            self.telegram_client.add_event_handler(
-                lambda event, group_id=group_id: self.handle_edited_message(event, group_id),
-                events.MessageEdited(chats=group_id)
-            )
+        self.config_mtime = os.path.getmtime(self.config_path)
+        self.load_routing_table(self.bot.config['telegram_chat_mirror_settings'])
+        self.register_telegram_handlers()
+        self.start_pipeline()
 
         await self.telegram_client.start()
         print("Telegram client started")
+
+        # Mirror the messages missed while the bot was offline, the messages missed while the client was reconnecting
+        # are caught up by handle_reconnect
+        await self.catch_up()
+        self.pipeline_tasks.append(asyncio.create_task(self._watch_routing_config()))
+
         await self.telegram_client.run_until_disconnected()
 
     """
-    Handle new messages from the Telegram group
+    Catch up the messages that were sent after the highest mirrored telegram message of every group, the messages are
+    fed through the mirror pipeline oldest first and the messages that already came in live are skipped by the ingest
     """
-    async def handle_new_message(self, event, group_id):
+    async def catch_up(self):
         await self.bot.get_cog('Database').db_initialization_event.wait()
 
-        if isinstance(group_id, InputPeerChannel):
-            if event.message.reply_to is None:
-                return
-            elif not (
-                event.message.reply_to.reply_to_msg_id == int(self.telegram_group_topics[self.telegram_group_ids.index(group_id)])
-                or event.message.reply_to.reply_to_top_id == int(self.telegram_group_topics[self.telegram_group_ids.index(group_id)])
-            ):
-                return
+        gateway = self.bot.get_cog('Database').gateway
 
-        message = self.split_message(event.message.text)
-        target_channel = self.bot.get_channel(self.target_channel_ids[self.telegram_group_ids.index(group_id)])
-        post_author = event.message.post_author or "Unknown Author"
+        for route in self.routing_table.routes:
+            try:
+                chat_id = utils.get_peer_id(await self.telegram_client.get_input_entity(route.peer))
+                last_message_id = await gateway.fetchone(
+                    "SELECT MAX(telegram_message_id) FROM telegram_discord_message WHERE group_id = ?",
+                    (chat_id,)
+                )
 
-        cursor.execute(
-            """
-            INSERT INTO telegram_messages (message_id, datetime) VALUES (?, ?)
-            """,
-            (event.message.id, (event.message.date + timedelta(hours=7)).strftime('%Y-%m-%d %H:%M:%S'))
-        )
+                # Skip the group that has never been mirrored instead of mirroring its whole history
+                if last_message_id is None or last_message_id[0] is None:
+                    continue
 
-        # Commit the all changes to the database
-        async with self.bot.get_cog('Database').db_lock:
-            database.commit()
+                caught_up = 0
+                # Only read the replies of the mirrored topic of the forum group
+                async for message in self.telegram_client.iter_messages(
+                    route.peer, min_id=last_message_id[0], reverse=True, limit=self.catch_up_limit,
+                    reply_to=route.topic_id
+                ):
+                    if await self.handle_new_message(events.NewMessage.Event(message)):
+                        caught_up += 1
 
-        file_temp = await self.telegram_client.download_media(event.message.media)
+                if caught_up:
+                    self.logger.info(f"Telegram catch up | Group ID: {chat_id} | {caught_up} missed messages queued")
+            except Exception as e:
+                self.logger.error(f"Telegram catch up failed | Group: {route.peer} | {e}")
 
-        if file_temp:
-            discord_message_ids = await self._send_media_message(
-                target_channel, message, post_author, event.message.date, file_temp, event.message.reply_to
-            )
+    """
+    Catch up the missed messages when the telegram client reconnected after losing the connection, called by the
+    telegram client right after every reconnect so even a short disconnect is caught up
+    """
+    async def handle_reconnect(self):
+        self.logger.info("Telegram client reconnected | Catching up missed messages")
+        try:
+            await self.catch_up()
+        except Exception as e:
+            self.logger.error(f"Telegram catch up after reconnect failed | {e}")
+
+    """
+    Reload the routing table without restarting the bot when config.json is changed
+    """
+    async def _watch_routing_config(self):
+        while True:
+            await asyncio.sleep(self.routing_config_check_interval)
+            self.reload_routing_table()
+
+    """
+    Start the workers of the download, render and persist stages of the mirror pipeline, the deliver stage has one
+    worker per target channel to keep the messages in order
+    """
+    def start_pipeline(self):
+        for queue, handler, stage in (
+            (self.download_queue, self._download_stage, 'download'),
+            (self.render_queue, self._render_stage, 'render')
+        ):
+            for _ in range(self.pipeline_workers[stage]):
+                self.pipeline_tasks.append(asyncio.create_task(self._stage_worker(queue, handler, stage)))
+
+        for _ in range(self.pipeline_workers['persist']):
+            self.pipeline_tasks.append(asyncio.create_task(self._persist_worker()))
+
+    """
+    Ingest new messages from the Telegram group into the mirror pipeline, returns whether the message was ingested
+    """
+    async def handle_new_message(self, event):
+        # Dispatch the message to the route of its chat and topic, the catch up messages are not filtered by the predicate
+        route = self.routing_table.match(event.chat_id, event.message.reply_to)
+        if route is None:
+            return False
+
+        # Skip the message that was already ingested, the live handler and the catch up both see the messages that
+        # arrive while the client reconnects. The last catch_up_limit ids of every group are enough to cover them
+        ingested_message_ids = self.ingested_message_ids.setdefault(event.chat_id, OrderedDict())
+        if event.message.id in ingested_message_ids:
+            return False
+        ingested_message_ids[event.message.id] = None
+        if len(ingested_message_ids) > self.catch_up_limit:
+            ingested_message_ids.popitem(last=False)
+
+        await self.bot.get_cog('Database').db_initialization_event.wait()
+
+        loop = asyncio.get_running_loop()
+        album_key = (event.chat_id, event.message.grouped_id)
+
+        # Add the album message to the job of the album that is still waiting for the flush window, discord message
+        # can only have 10 files
+        album_job = self.album_jobs.get(album_key)
+        if event.message.grouped_id is not None and album_job is not None and len(album_job.events) < 10:
+            album_job.events.append(event)
+            album_job.flush_at = loop.time() + self.album_flush_window
+            return True
+
+        target_channel = route.target_channel
+        job = MirrorJob(event, event.chat_id, target_channel)
+
+        # Start the deliver worker of the target channel if it is not running yet
+        if target_channel.id not in self.deliver_queues:
+            self.deliver_queues[target_channel.id] = asyncio.Queue(maxsize=self.pipeline_queue_size)
+            self.pipeline_tasks.append(asyncio.create_task(self._deliver_worker(self.deliver_queues[target_channel.id])))
+
+        # Collect the album messages in the background, so the handler does not hold up the next messages
+        if event.message.grouped_id is not None:
+            self.album_jobs[album_key] = job
+            job.flush_at = loop.time() + self.album_flush_window
+
+        # Queue the job in the arrival order of the target channel before it is downloaded and rendered concurrently,
+        # the full queues make the telegram handler wait
+        await self.deliver_queues[target_channel.id].put(job)
+
+        if event.message.grouped_id is not None:
+            flush_task = asyncio.create_task(self._flush_album(job, album_key))
+            flush_task.add_done_callback(self.pipeline_tasks.remove)
+            self.pipeline_tasks.append(flush_task)
         else:
-            discord_message_ids = await self._send_text_message(
-                target_channel, message, post_author, event.message.date, event.message.reply_to
-            )
+            await self.download_queue.put(job)
 
-        cursor.execute(
-            """
-            UPDATE telegram_messages SET discord_message_id = ? WHERE message_id = ?
-            """,
-            (json.dumps(discord_message_ids), event.message.id)
+        return True
+
+    """
+    Wait until the album stop getting new messages for the flush window, then download it as one job
+    """
+    async def _flush_album(self, job, album_key):
+        loop = asyncio.get_running_loop()
+        while (delay := job.flush_at - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+        if self.album_jobs.get(album_key) is job:
+            del self.album_jobs[album_key]
+
+        await self.download_queue.put(job)
+
+    """
+    Run the handler of the pipeline stage for every queued job, a failed job is marked so the deliver stage skips it
+    """
+    async def _stage_worker(self, queue, handler, stage):
+        while True:
+            job = await queue.get()
+            try:
+                await handler(job)
+            except Exception as e:
+                job.failed = True
+                job.ready.set()
+                self.logger.error(f"Telegram mirror {stage} failed | Telegram Message ID: {job.event.message.id} | {e}")
+            finally:
+                queue.task_done()
+
+    """
+    Download the media of the telegram messages into buffers that are spooled to disk only above the media spool size,
+    the media that does not fit in the max media size of the discord message is linked instead of uploaded, then pass
+    the job to the render stage
+    """
+    async def _download_stage(self, job):
+        remaining_size = self.max_media_size
+
+        for event in job.events:
+            media_file = event.message.file
+            if media_file is None:
+                continue
+
+            if media_file.size is not None and media_file.size > remaining_size:
+                job.media_links.append(self.format_media_link(job.group_id, event.message))
+                continue
+
+            # The buffer is closed by the deliver stage even if the download failed
+            media_buffer = tempfile.SpooledTemporaryFile(max_size=self.media_spool_size)
+            job.media_files.append((media_buffer, media_file.name or f"{event.message.id}{media_file.ext or ''}"))
+            await self.telegram_client.download_media(event.message.media, file=media_buffer)
+            media_buffer.seek(0)
+            remaining_size -= media_file.size or 0
+
+        await self.render_queue.put(job)
+
+    """
+    Split the telegram message into parts, then mark the job ready to deliver
+    """
+    async def _render_stage(self, job):
+        job.parts = split_message(
+            "\n".join(event.message.text for event in job.events if event.message.text),
+            header_length=len(self.format_header(job.event.message.post_author, job.event.message.date))
         )
+        job.ready.set()
+
+    """
+    Deliver the jobs of the target channel in the arrival order once they are ready and pass them to the persist stage,
+    the replied message is resolved here so the reply to an earlier job that is not saved yet still finds it
+    """
+    async def _deliver_worker(self, queue):
+        while True:
+            job = await queue.get()
+            try:
+                await job.ready.wait()
+                if job.failed:
+                    continue
+
+                job.replied_message = await self._fetch_replied_message(
+                    job.target_channel, job.group_id, job.event.message.reply_to
+                )
+
+                post_author = job.event.message.post_author or "Unknown Author"
+                if job.media_links:
+                    self.append_media_links(job.parts, job.media_links, job.event.message.post_author, job.event.message.date)
+
+                if job.media_files:
+                    job.discord_message_ids = await self._send_media_message(
+                        job.target_channel, job.parts, post_author, job.event.message.date,
+                        [discord.File(media_buffer, filename=media_name) for media_buffer, media_name in job.media_files],
+                        job.replied_message
+                    )
+                else:
+                    job.discord_message_ids = await self._send_text_message(
+                        job.target_channel, job.parts, post_author, job.event.message.date, job.replied_message
+                    )
+
+                # Remember the last discord message of the job until it is saved, for the replies behind it
+                for event in job.events:
+                    self.unsaved_message_ids[(job.group_id, event.message.id)] = job.discord_message_ids[-1]
+
+                await self.persist_queue.put(job)
+            except Exception as e:
+                self.logger.error(f"Telegram mirror deliver failed | Telegram Message ID: {job.event.message.id} | {e}")
+            finally:
+                for media_buffer, media_name in job.media_files:
+                    media_buffer.close()
+                queue.task_done()
 
-        # Commit the all changes to the database
-        async with self.bot.get_cog('Database').db_lock:
-            database.commit()
+    """
+    Save the mirrored discord message ids of the delivered jobs to the database, the jobs waiting in the queue are
+    saved together in one transaction and every message of an album is mapped to the same discord messages
+    """
+    async def _persist_worker(self):
+        while True:
+            jobs = [await self.persist_queue.get()]
+            while not self.persist_queue.empty():
+                jobs.append(self.persist_queue.get_nowait())
+
+            try:
+                rows = []
+                for job in jobs:
+                    message_datetime = (job.event.message.date + timedelta(hours=7)).strftime('%Y-%m-%d %H:%M:%S')
+                    content_hashes = [
+                        content_hash(content)
+                        for content in self.render_contents(job.parts, job.event.message.post_author, job.event.message.date)
+                    ]
+                    rows.extend(
+                        (
+                            job.group_id, event.message.id, part_index, discord_message_id, job.target_channel.id,
+                            message_datetime, content_hashes[part_index]
+                        )
+                        for event in job.events
+                        for part_index, discord_message_id in enumerate(job.discord_message_ids)
+                    )
+
+                await self.bot.get_cog('Database').gateway.executemany(
+                    """
+                    INSERT OR REPLACE INTO telegram_discord_message (
+                        group_id, telegram_message_id, part_index, discord_message_id, channel_id, datetime,
+                        content_hash
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    rows
+                )
+            except Exception as e:
+                self.logger.error(f"Telegram mirror persist failed | Jobs: {len(jobs)} | {e}")
+            finally:
+                for job in jobs:
+                    for event in job.events:
+                        self.unsaved_message_ids.pop((job.group_id, event.message.id), None)
+                    self.persist_queue.task_done()
 
     """
     Helper method for sending telegram messages to discord
     """
-    async def _send_text_message(self, channel, message, author, date, reply_to):
+    async def _send_text_message(self, channel, message, author, date, replied_message):
+        outbox = self.bot.get_cog('Discord Outbox')
         discord_message_ids = []
-        replied_message = await self._fetch_replied_message(channel, reply_to)
-
-        for part in message:
-            if part == message[0]:
-                discord_message = await channel.send("```{} | {}``` \n{}".format(
-                    author if author else "Unknown Author",
-                    date.strftime('%Y-%m-%d %H:%M:%S'),
-                    part
-                ), reference=replied_message)
+
+        for index, part in enumerate(message):
+            if index == 0:
+                discord_message = await outbox.send(
+                    channel, content=self.format_header(author, date) + part, reference=replied_message
+                )
             else:
-                discord_message = await channel.send(part)
+                discord_message = await outbox.send(channel, content=part)
             discord_message_ids.append(discord_message.id)
 
         return discord_message_ids
@@ -155,29 +683,19 @@ class TelegramToDiscord(commands.Cog):
     """
     Helper method for sending telegram messages with media to discord
     """
-    async def _send_media_message(self, channel, message, author, date, file_temp, reply_to):
+    async def _send_media_message(self, channel, message, author, date, media_files, replied_message):
+        outbox = self.bot.get_cog('Discord Outbox')
         discord_message_ids = []
-        replied_message = await self._fetch_replied_message(channel, reply_to)
-
-        for part in message:
-            if part == message[0] and len(message) > 1:
-                discord_message = await channel.send("```{} | {}``` \n{}".format(
-                    author if author else "Unknown Author",
-                    date.strftime('%Y-%m-%d %H:%M:%S'),
-                    part
-                ), reference=replied_message)
-            elif part == message[-1] and len(message) > 1:
-                discord_message = await channel.send(part, file=discord.File(file_temp), reference=replied_message)
-                os.remove(file_temp)
-            elif len(message) == 1:
-                discord_message = await channel.send("```{} | {}``` \n{}".format(
-                    author if author else "Unknown Author",
-                    date.strftime('%Y-%m-%d %H:%M:%S'),
-                    part
-                ), file=discord.File(file_temp), reference=replied_message)
-                os.remove(file_temp)
+
+        for index, part in enumerate(message):
+            content = self.format_header(author, date) + part if index == 0 else part
+
+            if index == len(message) - 1:
+                discord_message = await outbox.send(channel, content=content, files=media_files, reference=replied_message)
+            elif index == 0:
+                discord_message = await outbox.send(channel, content=content, reference=replied_message)
             else:
-                discord_message = await channel.send(part)
+                discord_message = await outbox.send(channel, content=part)
             discord_message_ids.append(discord_message.id)
 
         return discord_message_ids
@@ -185,56 +703,234 @@ class TelegramToDiscord(commands.Cog):
     """
     Helper method for fetch replied message from discord
     """
-    @staticmethod
-    async def _fetch_replied_message(channel, reply_to):
+    async def _fetch_replied_message(self, channel, group_id, reply_to):
         if reply_to:
-            cursor.execute(
+            # The replied message that is delivered but not saved yet is only known by the deliver workers
+            unsaved_message_id = self.unsaved_message_ids.get((group_id, reply_to.reply_to_msg_id))
+            if unsaved_message_id is not None:
+                return channel.get_partial_message(unsaved_message_id)
+
+            # Get the last part of the replied message, the legacy rows without group are used as fallback
+            replied_message_id = await self.bot.get_cog('Database').gateway.fetchone(
                 """
-                SELECT discord_message_id FROM telegram_messages WHERE message_id = ?
+                SELECT discord_message_id FROM telegram_discord_message
+                WHERE telegram_message_id = ? AND group_id IN (?, 0)
+                ORDER BY group_id = 0, part_index DESC
+                LIMIT 1
                 """,
-                (reply_to.reply_to_msg_id,)
+                (reply_to.reply_to_msg_id, group_id)
             )
 
-            replied_message_id = cursor.fetchone()
             if replied_message_id:
-                return await channel.fetch_message(int(json.loads(replied_message_id[0].strip())[-1]))
+                return await channel.fetch_message(replied_message_id[0])
 
         return None
 
     """
-    Handle edited messages from the Telegram group
+    Helper method for get the group id, discord message id and content hash of every mirrored part of the telegram message
     """
-    async def handle_edited_message(self, event, group_id):
-        await self.bot.get_cog('Database').db_initialization_event.wait()
+    async def _fetch_discord_message_parts(self, group_id, telegram_message_id):
+        rows = await self.bot.get_cog('Database').gateway.fetchall(
+            """
+            SELECT group_id, discord_message_id, content_hash FROM telegram_discord_message
+            WHERE telegram_message_id = ? AND group_id IN (?, 0)
+            ORDER BY group_id = 0, part_index
+            """,
+            (telegram_message_id, group_id)
+        )
 
-        cursor.execute(
+        # Keep the parts of the group first found, the legacy rows without group are used as fallback
+        return [row for row in rows if row[0] == rows[0][0]]
+
+    """
+    Helper method for get the telegram group id and message id of the mirrored discord message
+    """
+    async def get_telegram_message(self, discord_message_id):
+        return await self.bot.get_cog('Database').gateway.fetchone(
             """
-            SELECT discord_message_id FROM telegram_messages WHERE message_id = ?
+            SELECT group_id, telegram_message_id FROM telegram_discord_message WHERE discord_message_id = ?
             """,
-            (event.message.id,)
+            (discord_message_id,)
         )
 
-        discord_message_ids = cursor.fetchone()
-
-        if discord_message_ids:
-            discord_message_ids = json.loads(discord_message_ids[0].strip())
-            target_channel = self.bot.get_channel(self.target_channel_ids[self.telegram_group_ids.index(group_id)])
-            edited_message_parts = self.split_message(event.message.text)
-
-            for i, message_id in enumerate(discord_message_ids):
-                discord_message = await target_channel.fetch_message(int(message_id))
-
-                if i < len(edited_message_parts):
-                    if i == 0:
-                        await discord_message.edit(content="```{} | {}``` \n{}".format(
-                            event.message.post_author if event.message.post_author else "Unknown Author",
-                            (event.message.date + timedelta(hours=7)).strftime('%Y-%m-%d %H:%M:%S'),
-                            edited_message_parts[i]
-                        ))
-                    else:
-                        await discord_message.edit(content=edited_message_parts[i])
-                else:
-                    await discord_message.edit(content=".")
+    """
+    Handle edited messages from the Telegram group, only the mirrored parts whose content changed are edited, the new
+    parts are sent when the message grew and the surplus parts are deleted when it shrank
+    """
+    async def handle_edited_message(self, event):
+        route = self.routing_table.match(event.chat_id, event.message.reply_to)
+        if route is None:
+            return
+
+        await self.bot.get_cog('Database').db_initialization_event.wait()
+
+        discord_message_parts = await self._fetch_discord_message_parts(event.chat_id, event.message.id)
+        if not discord_message_parts:
+            return
+
+        gateway = self.bot.get_cog('Database').gateway
+        outbox = self.bot.get_cog('Discord Outbox')
+        target_channel = route.target_channel
+        row_group_id = discord_message_parts[0][0]
+        stored_hashes = {discord_message_id: stored_hash for _, discord_message_id, stored_hash in discord_message_parts}
+        discord_message_ids = list(stored_hashes)
+        statements = []
+
+        # Render the edited message the same way as the mirrored message
+        parts = split_message(
+            event.message.text,
+            header_length=len(self.format_header(event.message.post_author, event.message.date))
+        )
+        media_file = event.message.file
+        if event.message.grouped_id is None and media_file is not None and (media_file.size or 0) > self.max_media_size:
+            self.append_media_links(
+                parts, [self.format_media_link(event.chat_id, event.message)], event.message.post_author, event.message.date
+            )
+        contents = self.render_contents(parts, event.message.post_author, event.message.date)
+
+        # Pair the contents with the mirrored discord messages, the media stays on the last discord message
+        if media_file is not None and len(contents) < len(discord_message_ids):
+            kept_message_ids = discord_message_ids[:len(contents) - 1] + discord_message_ids[-1:]
+        else:
+            kept_message_ids = discord_message_ids[:len(contents)]
+
+        try:
+            # Delete the surplus discord messages when the message shrank
+            for discord_message_id in discord_message_ids:
+                if discord_message_id not in kept_message_ids:
+                    await outbox.delete(target_channel, discord_message_id, priority=PRIORITY_LOW)
+                    statements.append((
+                        "DELETE FROM telegram_discord_message WHERE discord_message_id = ?",
+                        (discord_message_id,)
+                    ))
+
+            # Edit only the discord messages whose content changed
+            for part_index, (discord_message_id, content) in enumerate(zip(kept_message_ids, contents)):
+                new_hash = content_hash(content)
+                if new_hash != stored_hashes[discord_message_id]:
+                    await outbox.edit(target_channel, discord_message_id, content=content)
+                    statements.append((
+                        "UPDATE telegram_discord_message SET content_hash = ? WHERE discord_message_id = ?",
+                        (new_hash, discord_message_id)
+                    ))
+                if part_index != discord_message_ids.index(discord_message_id):
+                    statements.append((
+                        """
+                        UPDATE telegram_discord_message SET part_index = ?
+                        WHERE group_id = ? AND telegram_message_id = ? AND discord_message_id = ?
+                        """,
+                        (part_index, row_group_id, event.message.id, discord_message_id)
+                    ))
+
+            # Send the new parts when the message grew
+            message_datetime = (event.message.date + timedelta(hours=7)).strftime('%Y-%m-%d %H:%M:%S')
+            for part_index in range(len(kept_message_ids), len(contents)):
+                discord_message = await outbox.send(target_channel, content=contents[part_index])
+                statements.append((
+                    """
+                    INSERT OR REPLACE INTO telegram_discord_message (
+                        group_id, telegram_message_id, part_index, discord_message_id, channel_id, datetime,
+                        content_hash
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        row_group_id, event.message.id, part_index, discord_message.id, target_channel.id,
+                        message_datetime, content_hash(contents[part_index])
+                    )
+                ))
+        finally:
+            # Save the changes that reached discord even if a later part failed
+            if statements:
+                await gateway.transaction(statements)
+
+    """
+    Handle deleted messages from the Telegram group, the mirrored discord messages of all deleted messages are resolved
+    in one query, bulk deleted on discord and removed from the database in one transaction
+    """
+    async def handle_deleted_message(self, event):
+        # Telegram only tells the chat of the deleted messages for channels and supergroups
+        if event.chat_id is None:
+            return
+
+        await self.bot.get_cog('Database').db_initialization_event.wait()
+
+        gateway = self.bot.get_cog('Database').gateway
+        statements = []
+
+        try:
+            # The legacy rows have no group and no channel, so they can not be matched to the deleted messages
+            rows = await gateway.fetchall(
+                f"""
+                SELECT DISTINCT channel_id, discord_message_id FROM telegram_discord_message
+                WHERE group_id = ? AND channel_id IS NOT NULL
+                AND telegram_message_id IN ({', '.join('?' * len(event.deleted_ids))})
+                """,
+                (event.chat_id, *event.deleted_ids)
+            )
+            if not rows:
+                return
+
+            # Keep the discord messages that still mirror a telegram message that is not deleted, every message of an
+            # album share the same discord messages so deleting one photo must not delete the whole album
+            discord_message_ids = [discord_message_id for _, discord_message_id in rows]
+            kept_rows = await gateway.fetchall(
+                f"""
+                SELECT DISTINCT discord_message_id FROM telegram_discord_message
+                WHERE discord_message_id IN ({', '.join('?' * len(discord_message_ids))})
+                AND NOT (group_id = ? AND telegram_message_id IN ({', '.join('?' * len(event.deleted_ids))}))
+                """,
+                (*discord_message_ids, event.chat_id, *event.deleted_ids)
+            )
+            kept_message_ids = {discord_message_id for discord_message_id, in kept_rows}
+
+            # Group the discord messages by channel and bulk delete them
+            channel_message_ids = {}
+            for channel_id, discord_message_id in rows:
+                if discord_message_id not in kept_message_ids:
+                    channel_message_ids.setdefault(channel_id, []).append(discord_message_id)
+
+            outbox = self.bot.get_cog('Discord Outbox')
+            for channel_id, message_ids in channel_message_ids.items():
+                if self.bot.get_channel(channel_id) is None:
+                    self.logger.warning(f"Deleted telegram messages | Channel ID: {channel_id} not found | Discord messages not deleted")
+                    continue
+                await outbox.delete_many(self.bot.get_channel(channel_id), message_ids, priority=PRIORITY_LOW)
+
+            # Only delete the mapping of the deleted telegram messages, the kept discord messages stay mapped to the rest
+            # of their album
+            deleted_ids = list(event.deleted_ids)
+            for index in range(0, len(deleted_ids), 500):
+                batch = deleted_ids[index:index + 500]
+                statements.append((
+                    f"DELETE FROM telegram_discord_message WHERE group_id = ? AND telegram_message_id IN ({', '.join('?' * len(batch))})",
+                    (event.chat_id, *batch)
+                ))
+            await gateway.transaction(statements)
+
+            self.logger.info(
+                f"Deleted telegram messages | Group ID: {event.chat_id} | "
+                f"{len(rows) - len(kept_message_ids)} mirrored discord messages deleted"
+            )
+        except Exception as e:
+            self.logger.error(f"Deleted telegram messages | Group ID: {event.chat_id} | Mirrored messages not deleted | {e}")
+
+    """
+    Remove the mapping of the mirrored discord message when it get deleted on discord
+    """
+    @commands.Cog.listener()
+    async def on_telegram_mirror_message_delete(self, payload):
+        await self.bot.get_cog('Database').db_initialization_event.wait()
+
+        telegram_message = await self.get_telegram_message(payload.message_id)
+
+        if telegram_message:
+            await self.bot.get_cog('Database').gateway.execute(
+                "DELETE FROM telegram_discord_message WHERE discord_message_id = ?",
+                (payload.message_id,)
+            )
+            self.logger.info(
+                f"Mirrored message deleted on discord | Telegram Message ID: {telegram_message[1]} | Mapping removed"
+            )
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -1,18 +1,60 @@
 import os
 import asyncio
+import aiohttp
 import discord
 from discord.ext import commands, tasks
-from web3 import Web3
+from web3 import AsyncWeb3
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
 import threading
 from waitress import serve
-import sqlite3
+from cogs.discord_outbox import PRIORITY_HIGH
 
 
 app = Flask(__name__)
-database = sqlite3.connect('data/data.db', timeout=5)
-cursor = database.cursor()
+
+# Only the functions of Multicall3 and ERC-20 that are used to read the treasury portfolio
+MULTICALL3_ABI = [
+    {
+        'inputs': [{
+            'components': [
+                {'internalType': 'address', 'name': 'target', 'type': 'address'},
+                {'internalType': 'bool', 'name': 'allowFailure', 'type': 'bool'},
+                {'internalType': 'bytes', 'name': 'callData', 'type': 'bytes'}
+            ],
+            'internalType': 'struct Multicall3.Call3[]', 'name': 'calls', 'type': 'tuple[]'
+        }],
+        'name': 'aggregate3',
+        'outputs': [{
+            'components': [
+                {'internalType': 'bool', 'name': 'success', 'type': 'bool'},
+                {'internalType': 'bytes', 'name': 'returnData', 'type': 'bytes'}
+            ],
+            'internalType': 'struct Multicall3.Result[]', 'name': 'returnData', 'type': 'tuple[]'
+        }],
+        'stateMutability': 'payable', 'type': 'function'
+    },
+    {
+        'inputs': [{'internalType': 'address', 'name': 'addr', 'type': 'address'}],
+        'name': 'getEthBalance',
+        'outputs': [{'internalType': 'uint256', 'name': 'balance', 'type': 'uint256'}],
+        'stateMutability': 'view', 'type': 'function'
+    }
+]
+ERC20_ABI = [
+    {
+        'inputs': [{'internalType': 'address', 'name': 'account', 'type': 'address'}],
+        'name': 'balanceOf',
+        'outputs': [{'internalType': 'uint256', 'name': '', 'type': 'uint256'}],
+        'stateMutability': 'view', 'type': 'function'
+    },
+    {
+        'inputs': [],
+        'name': 'decimals',
+        'outputs': [{'internalType': 'uint8', 'name': '', 'type': 'uint8'}],
+        'stateMutability': 'view', 'type': 'function'
+    }
+]
 
 
 class TreasuryMonitoring(commands.Cog, name='Treasury Monitoring'):
@@ -20,20 +62,44 @@ class TreasuryMonitoring(commands.Cog, name='Treasury Monitoring'):
         self.client = client
         self.config = self.client.config
         self.logger = self.client.logger
-        self.w3 = Web3(Web3.HTTPProvider(os.getenv('RPC_URL')))
-        self.treasury_address = self.config['treasury_monitoring_settings']['treasury_address']
-        self.usdc_contract = self.w3.eth.contract(
-            address=self.config['treasury_monitoring_settings']['usdc_contract_address'],
-            abi=self.config['treasury_monitoring_settings']['usdc_abi']
-        )
-        self.usdt_contract = self.w3.eth.contract(
-            address=self.config['treasury_monitoring_settings']['usdt_contract_address'],
-            abi=self.config['treasury_monitoring_settings']['usdt_abi']
+        self.w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(os.getenv('RPC_URL')))
+        self.rpc_session = None
+        self.treasury_addresses = [
+            AsyncWeb3.to_checksum_address(address)
+            for address in self.config['treasury_monitoring_settings']['treasury_addresses']
+        ]
+        self.lowercase_treasury_addresses = {address.lower() for address in self.treasury_addresses}
+        self.multicall_contract = self.w3.eth.contract(
+            address=AsyncWeb3.to_checksum_address(self.config['treasury_monitoring_settings']['multicall_address']),
+            abi=MULTICALL3_ABI
         )
-        self.last_block = self.w3.eth.block_number
+        self.token_contracts = {
+            token['symbol']: self.w3.eth.contract(address=AsyncWeb3.to_checksum_address(token['address']), abi=ERC20_ABI)
+            for token in self.config['treasury_monitoring_settings']['tokens']
+        }
+        self.token_decimals = {}
         self.alchemy_webhook_payload_data = {}
         self.treasury_balance_presence.start()
 
+    """
+    Give the RPC provider a session that keeps its connections alive, so the balance reads reuse the pooled connections
+    instead of opening a new connection for every request
+    """
+    async def cog_load(self) -> None:
+        self.rpc_session = aiohttp.ClientSession(
+            raise_for_status=True,
+            connector=aiohttp.TCPConnector(limit=self.config['treasury_monitoring_settings']['rpc_connection_limit'])
+        )
+        await self.w3.provider.cache_async_session(self.rpc_session)
+
+    """
+    Stop the treasury balance presence and close the RPC session when the cog is unloaded
+    """
+    async def cog_unload(self) -> None:
+        self.treasury_balance_presence.cancel()
+        if self.rpc_session is not None:
+            await self.rpc_session.close()
+
     """
     Static method to censor the wallet address
     """
@@ -41,6 +107,70 @@ class TreasuryMonitoring(commands.Cog, name='Treasury Monitoring'):
     def censor_wallet_address(address):
         return f"{address[:7]}...{address[-5:]}" if len(address) >= 20 else address
 
+    """
+    Run the calls in one Multicall3 aggregate3 call, the failed calls are returned as None instead of failing the
+    whole batch
+    """
+    async def _aggregate(self, calls, output_type):
+        results = await self.multicall_contract.functions.aggregate3(
+            [(target, True, call_data) for target, call_data in calls]
+        ).call()
+
+        return [
+            self.w3.codec.decode([output_type], return_data)[0] if success and return_data else None
+            for success, return_data in results
+        ]
+
+    """
+    Read the decimals of the tokens that are not cached yet, the decimals never change so they are read only once
+    """
+    async def _load_token_decimals(self) -> None:
+        symbols = [symbol for symbol in self.token_contracts if symbol not in self.token_decimals]
+        if not symbols:
+            return
+
+        decimals = await self._aggregate(
+            [(self.token_contracts[symbol].address, self.token_contracts[symbol].encode_abi('decimals')) for symbol in symbols],
+            'uint8'
+        )
+        for symbol, token_decimals in zip(symbols, decimals):
+            if token_decimals is None:
+                self.logger.warning(f"Token decimals not loaded | Token: {symbol}")
+            else:
+                self.token_decimals[symbol] = token_decimals
+
+    """
+    Read the ETH and token balances of every treasury address in one Multicall3 call, the balances are returned per
+    address and asset
+    """
+    async def get_portfolio(self) -> dict:
+        await self._load_token_decimals()
+
+        assets = [('ETH', self.multicall_contract, 'getEthBalance', 18)]
+        assets.extend(
+            (symbol, contract, 'balanceOf', self.token_decimals[symbol])
+            for symbol, contract in self.token_contracts.items() if symbol in self.token_decimals
+        )
+
+        calls = [
+            (contract.address, contract.encode_abi(function, [address]))
+            for address in self.treasury_addresses
+            for _, contract, function, _ in assets
+        ]
+        balances = iter(await self._aggregate(calls, 'uint256'))
+
+        portfolio = {}
+        for address in self.treasury_addresses:
+            portfolio[address] = {}
+            for symbol, _, _, decimals in assets:
+                balance = next(balances)
+                if balance is None:
+                    self.logger.warning(f"Treasury balance not read | Address: {self.censor_wallet_address(address)} | Asset: {symbol}")
+                else:
+                    portfolio[address][symbol] = balance / 10 ** decimals
+
+        return portfolio
+
     """
     Update the bot presence with the treasury balance every 30 seconds
     """
@@ -49,22 +179,29 @@ class TreasuryMonitoring(commands.Cog, name='Treasury Monitoring'):
         await self.client.get_cog('Database').db_initialization_event.wait()
 
         try:
-            # Get the treasury balance
-            checksum_treasury_address = self.w3.to_checksum_address(self.treasury_address)
-            eth_balance = round(self.w3.from_wei(self.w3.eth.get_balance(checksum_treasury_address), 'ether'), 5)
-            usdc_balance = round(self.usdc_contract.functions.balanceOf(checksum_treasury_address).call() / 10 ** 6, 2)
-            usdt_balance = round(self.usdt_contract.functions.balanceOf(checksum_treasury_address).call() / 10 ** 6, 2)
+            # Get the total balance of every asset over all the treasury addresses, the asset that could not be read
+            # is shown as unavailable instead of zero
+            portfolio = await self.get_portfolio()
+            total_balances = dict.fromkeys(['ETH', *self.token_contracts])
+            for balances in portfolio.values():
+                for symbol, balance in balances.items():
+                    total_balances[symbol] = (total_balances[symbol] or 0) + balance
+
+            treasury_balance = " | ".join(
+                f"{symbol}: n/a" if balance is None else f"{symbol}: {round(balance, 5 if symbol == 'ETH' else 2)}"
+                for symbol, balance in total_balances.items()
+            )
 
             # Change the bot presence
             await self.client.change_presence(activity=discord.Activity(
                     type=discord.ActivityType.watching,
                     name="Treasury Balance",
-                    state="ETH: {0} | USDC: {1} | USDT: {2}".format(eth_balance, usdc_balance, usdt_balance),
+                    state=treasury_balance[:128],
                 )
             )
 
             # Log the treasury balance
-            self.logger.info(f"Bot presence updated | ETH: {eth_balance}, USDC: {usdc_balance}, USDT: {usdt_balance}")
+            self.logger.info(f"Bot presence updated | {treasury_balance}")
         except Exception as e:
             self.logger.error(f"Failed to update bot presence | {e}")
 
@@ -87,8 +224,10 @@ class TreasuryMonitoring(commands.Cog, name='Treasury Monitoring'):
     async def transaction_monitoring(self) -> None:
         await self.client.get_cog('Database').db_initialization_event.wait()
 
+        gateway = self.client.get_cog('Database').gateway
+
         try:
-            cursor.execute(
+            known_transaction = await gateway.fetchone(
                 "SELECT 1 FROM treasury_monitoring WHERE tx_hash = ?",
                 (self.alchemy_webhook_payload_data['event']['activity'][0]['hash'],)
             )
@@ -104,62 +243,44 @@ class TreasuryMonitoring(commands.Cog, name='Treasury Monitoring'):
             embed.add_field(name="Recipient", value=self.censor_wallet_address(self.alchemy_webhook_payload_data['event']['activity'][0]['toAddress']), inline=True)
 
             # Check if the transaction is outgoing or incoming and tx_hash is not already in the database
-            if self.alchemy_webhook_payload_data['event']['activity'][0]['value'] > 0 and cursor.fetchone() is None:
-                if self.alchemy_webhook_payload_data['event']['activity'][0]['fromAddress'].lower() == self.treasury_address.lower():
-                    await target_channel.send(embed=embed)
-
-                    # Insert the transaction hash into the database
-                    cursor.execute(
-                        """
-                        INSERT INTO treasury_monitoring (
-                            tx_hash, value, asset, from_address, to_address, timestamp
-                        ) VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['hash'],
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['value'],
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['asset'],
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['fromAddress'],
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['toAddress'],
-                            self.alchemy_webhook_payload_data['createdAt']
-                        )
-                    )
-
-                    # Commit the all changes to the database
-                    async with self.client.get_cog('Database').db_lock:
-                        database.commit()
+            if self.alchemy_webhook_payload_data['event']['activity'][0]['value'] > 0 and known_transaction is None:
+                outgoing = self.alchemy_webhook_payload_data['event']['activity'][0]['fromAddress'].lower() in self.lowercase_treasury_addresses
+                incoming = self.alchemy_webhook_payload_data['event']['activity'][0]['toAddress'].lower() in self.lowercase_treasury_addresses
+                if not outgoing and not incoming:
+                    return
 
-                    self.logger.info(
-                        f"Outgoing transaction detected | Tx: {self.alchemy_webhook_payload_data['event']['activity'][0]['hash']}")
-
-                if self.alchemy_webhook_payload_data['event']['activity'][0]['toAddress'].lower() == self.treasury_address.lower():
+                # The transfer between two treasury addresses is notified and saved once
+                if outgoing and incoming:
+                    direction = "Internal"
+                    embed.description = "Transaction between the treasury addresses"
+                elif incoming:
+                    direction = "Incoming"
                     embed.description = "Incoming transaction to the treasury address"
+                else:
+                    direction = "Outgoing"
 
-                    await target_channel.send(embed=embed)
-
-                    # Insert the transaction hash into the database
-                    cursor.execute(
-                        """
-                        INSERT INTO treasury_monitoring (
-                            tx_hash, value, asset, from_address, to_address, timestamp
-                        ) VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['hash'],
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['value'],
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['asset'],
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['fromAddress'],
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['toAddress'],
-                            self.alchemy_webhook_payload_data['event']['activity'][0]['blockTimestamp']
-                        )
-                    )
+                await self.client.get_cog('Discord Outbox').send(target_channel, priority=PRIORITY_HIGH, embed=embed)
 
-                    # Commit the all changes to the database
-                    async with self.client.get_cog('Database').db_lock:
-                        database.commit()
+                # Insert the transaction hash into the database and commit the changes
+                await gateway.execute(
+                    """
+                    INSERT INTO treasury_monitoring (
+                        tx_hash, value, asset, from_address, to_address, timestamp
+                    ) VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        self.alchemy_webhook_payload_data['event']['activity'][0]['hash'],
+                        self.alchemy_webhook_payload_data['event']['activity'][0]['value'],
+                        self.alchemy_webhook_payload_data['event']['activity'][0]['asset'],
+                        self.alchemy_webhook_payload_data['event']['activity'][0]['fromAddress'],
+                        self.alchemy_webhook_payload_data['event']['activity'][0]['toAddress'],
+                        self.alchemy_webhook_payload_data['createdAt'] if outgoing
+                        else self.alchemy_webhook_payload_data['event']['activity'][0]['blockTimestamp']
+                    )
+                )
 
-                    self.logger.info(
-                        f"Incoming transaction detected | Tx: {self.alchemy_webhook_payload_data['event']['activity'][0]['hash']}")
+                self.logger.info(
+                    f"{direction} transaction detected | Tx: {self.alchemy_webhook_payload_data['event']['activity'][0]['hash']}")
         except Exception as e:
             self.logger.error(f"Failed to send the notification | {e}")
 
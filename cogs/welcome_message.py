@@ -20,8 +20,9 @@ class WelcomeMessage(commands.Cog, name='Welcome Message'):
         embed = discord.Embed().set_image(url=self.config['welcome_message_settings']['welcome_image_url'])
 
         try:
-            await welcome_channel.send(
-                welcome_message.format(
+            await self.client.get_cog('Discord Outbox').send(
+                welcome_channel,
+                content=welcome_message.format(
                     member=getattr(member, self.config['welcome_message_settings']['member_function']),
                     rules_channel_id=int(self.config['welcome_message_settings']['rules_channel_id'])),
                 embed=embed)